@@ -0,0 +1,91 @@
+"""Achievement catalog and the rules engine that awards them.
+
+Each achievement watches one counter ("metric") and completes once that
+counter reaches its threshold. The engine is run by whoever changes a
+counter, inside that writer's transaction, so reads never have to evaluate
+anything.
+"""
+
+# Catalog of achievements: metric is the counter watched, threshold completes it
+ACHIEVEMENTS = [
+    {
+        'id': 1,
+        'title': '7-Day Streak',
+        'description': 'Logged in for 7 consecutive days',
+        'points': 50,
+        'metric': 'streak',
+        'threshold': 7
+    },
+    {
+        'id': 2,
+        'title': '30-Day Journey',
+        'description': 'Reached 30 days in your healing journey',
+        'points': 100,
+        'metric': 'days_strong',
+        'threshold': 30
+    },
+    {
+        'id': 3,
+        'title': 'Ghost Mode Master',
+        'description': 'Used Ghost Mode features for 30 days',
+        'points': 150,
+        'metric': 'ghost_mode_days',
+        'threshold': 30
+    },
+]
+
+ACHIEVEMENTS_BY_ID = {achievement['id']: achievement for achievement in ACHIEVEMENTS}
+
+ACHIEVEMENTS_BY_METRIC = {}
+for _achievement in ACHIEVEMENTS:
+    ACHIEVEMENTS_BY_METRIC.setdefault(_achievement['metric'], []).append(_achievement)
+
+def describe(achievement):
+    """Public fields of a catalog entry (rule internals stay server-side)"""
+    return {
+        'id': achievement['id'],
+        'title': achievement['title'],
+        'description': achievement['description'],
+        'points': achievement['points']
+    }
+
+def evaluate(conn, user_id, metrics):
+    """Award achievements unlocked by the given counter values.
+
+    `metrics` maps counter names (e.g. a users row) to their new values; only
+    rules watching one of those counters are checked. Awards and their points
+    are written on `conn`, so they commit or roll back with the caller's
+    change. Returns (newly awarded achievements, points added).
+    """
+    awarded = []
+    points_added = 0
+    pending = dict(metrics)
+
+    # Awarded points can themselves unlock 'points' rules, so repeat until quiet
+    while pending:
+        new_awards = []
+        for metric, value in pending.items():
+            if value is None:
+                continue
+            for achievement in ACHIEVEMENTS_BY_METRIC.get(metric, ()):
+                if value < achievement['threshold']:
+                    continue
+                cursor = conn.execute('''
+                INSERT OR IGNORE INTO user_achievements (user_id, achievement_id)
+                VALUES (?, ?)
+                ''', (user_id, achievement['id']))
+                if cursor.rowcount == 1:
+                    new_awards.append(achievement)
+
+        if not new_awards:
+            break
+
+        bonus = sum(achievement['points'] for achievement in new_awards)
+        row = conn.execute('''
+        UPDATE users SET points = points + ? WHERE id = ? RETURNING points
+        ''', (bonus, user_id)).fetchone()
+        awarded.extend(new_awards)
+        points_added += bonus
+        pending = {'points': row['points']} if row else {}
+
+    return awarded, points_added
@@ -0,0 +1,159 @@
+"""In-process admission control for the API.
+
+Every /api request is checked before any database or hashing work:
+
+1. Load shedding. A worker that already has max_in_flight requests running
+   answers 503 right away. While the smoothed request latency is above
+   latency_target, routes costing more than 1 (login, register, writes) are
+   shed with a probability that rises with the overshoot. Cheap reads keep
+   flowing, and the latency signal keeps updating.
+2. Throttling. Each client IP and each authenticated user has a token bucket.
+   A request spends its route's cost, and an empty bucket answers 429 with
+   the number of seconds until enough tokens have refilled.
+
+Buckets live in a bounded LRU of (tokens, timestamp) tuples, so memory stays
+flat no matter how many clients show up. Evicting an idle bucket is
+harmless, because an idle bucket is full anyway.
+"""
+import math
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+def _env_float(name, default):
+    return float(os.environ.get(name, default))
+
+# Token buckets: sustained requests-per-second worth of tokens, and burst size
+IP_RATE = _env_float('CRUMBLE_RATE_PER_IP', 20)
+IP_BURST = _env_float('CRUMBLE_BURST_PER_IP', 60)
+USER_RATE = _env_float('CRUMBLE_RATE_PER_USER', 10)
+USER_BURST = _env_float('CRUMBLE_BURST_PER_USER', 30)
+MAX_BUCKETS = int(os.environ.get('CRUMBLE_MAX_BUCKETS', '100000'))
+
+# Tokens spent per request; anything unlisted costs DEFAULT_COST
+DEFAULT_COST = 1
+ROUTE_COSTS = {
+    '/api/login': 5,
+    '/api/register': 10,
+    '/api/user/update-points': 2,
+    '/api/user/rewards/claim': 2,
+    '/api/messages/render': 5,
+    '/api/quiz/magic/recommend': 2,
+    '/api/quiz/magic/submit': 2,
+    '/api/templates:POST': 2,
+    '/api/user/ghost-mode/settings:POST': 2,
+    '/api/user/social-platforms:POST': 2,
+    '/api/user/social-platforms:DELETE': 2,
+}
+
+# Load shedding
+MAX_IN_FLIGHT = int(os.environ.get('CRUMBLE_MAX_IN_FLIGHT', '64'))
+LATENCY_TARGET = _env_float('CRUMBLE_LATENCY_TARGET', 1.0)
+LATENCY_ALPHA = 0.1
+MAX_SHED_PROBABILITY = 0.9
+RETRY_AFTER = 1
+
+# Number of reverse proxies in front of the app whose X-Forwarded-For is trusted
+TRUSTED_PROXY_HOPS = int(os.environ.get('CRUMBLE_TRUSTED_PROXY_HOPS', '0'))
+
+class TokenBuckets:
+    """Token buckets keyed by client, stored compactly in a bounded LRU"""
+    def __init__(self, rate, burst, maxsize=MAX_BUCKETS):
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, cost, now=None):
+        """Spend cost tokens; returns 0 on success, else seconds until they are available"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = (cost - tokens) / self.rate if self.rate > 0 else float('inf')
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+class Rejection:
+    """Why a request was turned away, and when the client may retry"""
+    def __init__(self, status, reason, retry_after):
+        self.status = status
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+class AdmissionController:
+    def __init__(self, ip_buckets=None, user_buckets=None, route_costs=None,
+                 max_in_flight=MAX_IN_FLIGHT, latency_target=LATENCY_TARGET):
+        self.ip_buckets = ip_buckets or TokenBuckets(IP_RATE, IP_BURST)
+        self.user_buckets = user_buckets or TokenBuckets(USER_RATE, USER_BURST)
+        self.route_costs = ROUTE_COSTS if route_costs is None else route_costs
+        self.max_in_flight = max_in_flight
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self.latency = 0.0
+        self._lock = threading.Lock()
+
+    def cost(self, route, method):
+        return self.route_costs.get(f'{route}:{method}', self.route_costs.get(route, DEFAULT_COST))
+
+    def shed_probability(self):
+        """Chance of shedding an expensive request at the current smoothed latency"""
+        if self.latency_target <= 0 or self.latency <= self.latency_target:
+            return 0.0
+        overshoot = (self.latency - self.latency_target) / self.latency_target
+        return min(MAX_SHED_PROBABILITY, overshoot)
+
+    def admit(self, route, method, ip, user_id=None):
+        """Admit a request (returns None; call release() when done) or return a Rejection"""
+        cost = self.cost(route, method)
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                return Rejection(503, 'overloaded', RETRY_AFTER)
+            if cost > DEFAULT_COST and random.random() < self.shed_probability():
+                return Rejection(503, 'shedding', RETRY_AFTER)
+            self.in_flight += 1
+
+        now = time.monotonic()
+        wait = self.ip_buckets.take(ip, cost, now)
+        if not wait and user_id is not None:
+            wait = self.user_buckets.take(user_id, cost, now)
+        if wait:
+            self.release()
+            return Rejection(429, 'throttled', wait)
+        return None
+
+    def release(self, seconds=None):
+        """Finish an admitted request, feeding its latency into the shedding signal"""
+        with self._lock:
+            self.in_flight -= 1
+            if seconds is not None:
+                self.latency += LATENCY_ALPHA * (seconds - self.latency)
+
+_warned_untrusted_proxy = False
+
+def client_ip(remote_addr, forwarded_for=None, trusted_hops=TRUSTED_PROXY_HOPS):
+    """The client address, honouring X-Forwarded-For only from trusted proxies"""
+    global _warned_untrusted_proxy
+    if forwarded_for and not trusted_hops and not _warned_untrusted_proxy:
+        # Behind a proxy every request would share the proxy's per-IP bucket
+        _warned_untrusted_proxy = True
+        print(f"Admission: X-Forwarded-For received but CRUMBLE_TRUSTED_PROXY_HOPS is 0, so all "
+              f"clients are throttled as {remote_addr}; set it to the number of proxies in front of the app")
+    if trusted_hops and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(',') if hop.strip()]
+        if len(hops) >= trusted_hops:
+            return hops[-trusted_hops]
+    return remote_addr or 'unknown'
@@ -1,21 +1,120 @@
 import sqlite3
 import os
-from flask import Flask, request, jsonify, send_file, send_from_directory, Response
+from flask import Flask, request, jsonify, send_file, send_from_directory, Response, g
 from flask.typing import ResponseReturnValue
 from typing import Union
 from flask_cors import CORS
 import jwt
 import datetime
+import functools
+import hashlib
+import time
 import os
-from werkzeug.security import check_password_hash, generate_password_hash
 import database as db
+import passwords
+import achievements
+import compression
+import templates
+from recommender import QuizRecommender, RecommendationError
+from admission import AdmissionController, client_ip
+from catalog import AssetCatalog
+from static_files import StaticFiles
+from cache import TTLCache
+from metrics import metrics
 
-app = Flask(__name__, static_folder='public', static_url_path='')
-CORS(app)
+app = Flask(__name__, static_folder=None)
+# Let browser clients read the pagination cursor
+CORS(app, expose_headers=['X-Next-Cursor'])
 
 SECRET_KEY = 'your-secret-key'  # In production, use a secure key
 
+# Asset CSVs are parsed and serialized once per worker, not per request
+catalog = AssetCatalog()
+catalog.load_all()
+
+# The built frontend is indexed (and precompressed) once per worker
+static_files = StaticFiles()
+static_files.load()
+
+@app.before_request
+def start_request_timer() -> None:
+    g.request_started = time.perf_counter()
+
+# Per-worker throttling and load shedding for /api, checked before any real work
+admission = AdmissionController()
+
+@app.before_request
+def admit_request() -> ResponseReturnValue | None:
+    if not request.path.startswith('/api/') or request.method == 'OPTIONS':
+        return None
+    
+    route = request.url_rule.rule if request.url_rule else request.path
+    claims = verify_authorization(request.headers.get('Authorization'))
+    ip = client_ip(request.remote_addr, request.headers.get('X-Forwarded-For'))
+    rejection = admission.admit(route, request.method, ip, claims['user_id'] if claims else None)
+    if rejection:
+        return rejected_response(rejection)
+    g.admitted_at = time.perf_counter()
+    return None
+
+@app.teardown_request
+def release_admission(error) -> None:
+    admitted_at = g.pop('admitted_at', None)
+    if admitted_at is not None:
+        admission.release(time.perf_counter() - admitted_at)
+
+@app.after_request
+def record_request_metrics(response: Response) -> Response:
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe_request(route, request.method, response.status_code, time.perf_counter() - started)
+    return response
+
+@app.after_request
+def compress_response(response: Response) -> Response:
+    return compression.compress_response(request, response)
+
+@app.teardown_request
+def record_failed_request(error) -> None:
+    # Unhandled exceptions skip after_request, so count them as 500s here
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe_request(route, request.method, 500, time.perf_counter() - started)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics() -> ResponseReturnValue:
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def catalog_response(name) -> Response:
+    """Serve a pre-encoded catalog entry, answering If-None-Match with 304"""
+    entry = catalog.get(name)
+    if request.if_none_match.contains_weak(entry.etag):
+        response = Response(status=304)
+    else:
+        response = Response(entry.body, mimetype='application/json')
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = 'public, no-cache'
+    return response
+
 # Routes
+def busy_response(retry_after) -> ResponseReturnValue:
+    """503 telling the client when to retry"""
+    response = jsonify({'message': 'Server is busy, please try again shortly'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def rejected_response(rejection) -> ResponseReturnValue:
+    """429 for a throttled client, 503 when the worker is shedding load"""
+    if rejection.status == 503:
+        return busy_response(rejection.retry_after)
+    response = jsonify({'message': 'Too many requests, please slow down'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(rejection.retry_after)
+    return response
+
 @app.route('/api/register', methods=['POST'])
 def register() -> ResponseReturnValue:
     data = request.get_json()
@@ -24,7 +123,10 @@ def register() -> ResponseReturnValue:
         return jsonify({'message': 'Missing required fields'}), 400
     
     # Create new user in database
-    user, error = db.create_user(data['username'], data['email'], data['password'])
+    try:
+        user, error = db.create_user(data['username'], data['email'], data['password'])
+    except passwords.PoolSaturated as e:
+        return busy_response(e.retry_after)
     
     if error:
         return jsonify({'message': error}), 400
@@ -41,19 +143,29 @@ def login() -> ResponseReturnValue:
     if not data or not data.get('email') or not data.get('password'):
         return jsonify({'message': 'Missing email or password'}), 400
     
-    # Find user in database
-    user = db.get_user_by_email(data['email'])
+    # Find user in database (the one read that needs the password hash)
+    user = db.get_user_credentials(data['email'])
     
-    if not user or not check_password_hash(user['password'], data['password']):
-        return jsonify({'message': 'Invalid credentials'}), 401
+    try:
+        if not user or not passwords.verify_password(user['password'], data['password']):
+            return jsonify({'message': 'Invalid credentials'}), 401
+        
+        # Transparently upgrade hashes made with older KDF parameters
+        if passwords.needs_rehash(user['password']):
+            db.update_user_password(user['id'], passwords.hash_password(data['password']))
+    except passwords.PoolSaturated as e:
+        return busy_response(e.retry_after)
     
-    # Generate token
+    return jsonify(login_payload(user))
+
+def login_payload(user) -> dict:
+    """A fresh token plus the public profile returned by /api/login"""
     token = jwt.encode({
         'user_id': user['id'],
         'exp': datetime.datetime.utcnow() + datetime.timedelta(days=1)
     }, SECRET_KEY)
     
-    return jsonify({
+    return {
         'token': token,
         'user': {
             'id': user['id'],
@@ -63,7 +175,7 @@ def login() -> ResponseReturnValue:
             'streak': user['streak'],
             'days_strong': user['days_strong']
         }
-    })
+    }
 
 @app.route('/api/messages/generate', methods=['GET'])
 def generate_message() -> ResponseReturnValue:
@@ -85,31 +197,74 @@ def generate_message() -> ResponseReturnValue:
     
     return jsonify({'message': message})
 
+# Verified token claims, keyed by a digest of the raw token
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TTL = 300
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+
 def verify_token() -> dict | None:
-    auth_header = request.headers.get('Authorization')
+    return verify_authorization(request.headers.get('Authorization'))
+
+def verify_authorization(auth_header) -> dict | None:
+    """Verified claims for an 'Authorization: Bearer ...' header value, or None"""
     if not auth_header or not auth_header.startswith('Bearer '):
         return None
     
     token = auth_header.split(' ')[1]
+    key = hashlib.sha256(token.encode('utf-8')).digest()
+    now = time.time()
+    
+    claims = token_cache.get(key)
+    if claims is not None:
+        if claims.get('exp', now + 1) > now:
+            return claims
+        token_cache.delete(key)
+        return None
+    
     try:
-        return jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+        claims = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
+    
+    # Never keep a token cached past its own expiry
+    ttl = TOKEN_CACHE_TTL
+    if 'exp' in claims:
+        ttl = min(ttl, claims['exp'] - now)
+    if ttl > 0:
+        token_cache.set(key, claims, ttl=ttl)
+    return claims
+
+def login_required(view):
+    """Reject requests without a valid bearer token; exposes g.user_id to the view"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        token_data = verify_token()
+        if not token_data:
+            return jsonify({'message': 'Invalid or expired token'}), 401
+        g.token_data = token_data
+        g.user_id = token_data['user_id']
+        return view(*args, **kwargs)
+    return wrapper
+
+def current_user() -> dict | None:
+    """The authenticated user's row, loaded at most once per request"""
+    if 'user' not in g:
+        g.user = db.get_user_by_id(g.user_id)
+    return g.user
 
 @app.route('/api/user/update-points', methods=['POST'])
+@login_required
 def update_points() -> ResponseReturnValue:
-    token_data = verify_token()
-    if not token_data:
-        return jsonify({'message': 'Invalid or expired token'}), 401
-    
     data = request.get_json()
     if not data or 'points' not in data:
         return jsonify({'message': 'Missing required fields'}), 400
     
-    user_id = token_data['user_id']
+    user_id = g.user_id
     points = data['points']
+    if not isinstance(points, int) or isinstance(points, bool):
+        return jsonify({'message': 'Points must be an integer'}), 400
     
     # Update user points using database module
     result, error = db.update_user_points(user_id, points)
@@ -128,12 +283,9 @@ def update_points() -> ResponseReturnValue:
     })
 
 @app.route('/api/user/ghost-mode/settings', methods=['GET', 'POST'])
+@login_required
 def ghost_mode_settings() -> ResponseReturnValue:
-    token_data = verify_token()
-    if not token_data:
-        return jsonify({'message': 'Invalid or expired token'}), 401
-    
-    user_id = token_data['user_id']
+    user_id = g.user_id
     
     if request.method == 'GET':
         settings = db.get_ghost_mode_settings(user_id)
@@ -154,12 +306,7 @@ def ghost_mode_settings() -> ResponseReturnValue:
             if settings is None:
                 return jsonify({'message': 'Failed to retrieve ghost mode settings'}), 500
         
-        return jsonify({
-            'blockMessages': bool(settings.get('block_messages', False)),
-            'hideStatus': bool(settings.get('hide_status', False)),
-            'muteNotifications': bool(settings.get('mute_notifications', False)),
-            'hideActivity': bool(settings.get('hide_activity', False))
-        })
+        return jsonify(ghost_settings_payload(settings))
     
     # POST method
     data = request.get_json()
@@ -181,18 +328,27 @@ def ghost_mode_settings() -> ResponseReturnValue:
     if not db.update_ghost_mode_settings(user_id, settings):
         return jsonify({'message': 'Failed to update ghost mode settings'}), 500
     
+    if any(settings[field] for field in required_fields):
+        db.log_ghost_mode_activity(user_id, 'settings_update')
+    
     return jsonify({
         'message': 'Ghost mode settings updated successfully',
         'settings': settings
     })
 
+def ghost_settings_payload(settings) -> dict:
+    """Ghost mode settings row in the camelCase shape the frontend uses"""
+    return {
+        'blockMessages': bool(settings.get('block_messages', False)),
+        'hideStatus': bool(settings.get('hide_status', False)),
+        'muteNotifications': bool(settings.get('mute_notifications', False)),
+        'hideActivity': bool(settings.get('hide_activity', False))
+    }
+
 @app.route('/api/user/ghost-mode/days', methods=['GET'])
+@login_required
 def get_ghost_mode_days() -> ResponseReturnValue:
-    token_data = verify_token()
-    if not token_data:
-        return jsonify({'message': 'Invalid or expired token'}), 401
-    
-    user_id = token_data['user_id']
+    user_id = g.user_id
     
     ghost_mode_days = db.get_ghost_mode_days(user_id)
     if ghost_mode_days is None:
@@ -200,52 +356,131 @@ def get_ghost_mode_days() -> ResponseReturnValue:
     
     return jsonify({'days': ghost_mode_days})
 
+@app.route('/api/breakup-messages', methods=['GET'])
+def search_breakup_messages() -> ResponseReturnValue:
+    """A page of the message library: ?q=&type=&tone=&limit=&cursor=
+    
+    The body is the page; X-Next-Cursor carries the cursor for the next one.
+    """
+    message_type = request.args.get('type')
+    if message_type and message_type not in ['emoji', 'call', 'text']:
+        return jsonify({'message': 'Invalid message type'}), 400
+    limit = request.args.get('limit', 20, type=int)
+    
+    page, error = db.search_breakup_messages(request.args.get('q'), message_type, request.args.get('tone'),
+                                             limit, request.args.get('cursor'))
+    if error and error.startswith('Database error'):
+        app.logger.error(f'Error searching breakup messages: {error}')
+        return jsonify({'message': 'Error loading messages'}), 500
+    if error:
+        return jsonify({'message': error}), 400
+    return page_response(page)
+
+def user_list_response(name, user_id, transform=None) -> ResponseReturnValue:
+    """Serve one page of a per-user list (?limit=&cursor=) via db.get_user_list_page"""
+    limit = request.args.get('limit', db.USER_LIST_DEFAULT_LIMIT, type=int)
+    page, error = db.get_user_list_page(name, user_id, limit, request.args.get('cursor'))
+    if error and error.startswith('Database error'):
+        app.logger.error(f'Error loading {name}: {error}')
+        return jsonify({'message': 'Internal server error'}), 500
+    if error:
+        return jsonify({'message': error}), 400
+    if transform:
+        page['items'] = transform(page['items'])
+    return page_response(page)
+
+def page_response(page) -> Response:
+    """A keyset page as a JSON list, with the next cursor in X-Next-Cursor"""
+    response = jsonify(page['items'])
+    if page['next_cursor']:
+        response.headers['X-Next-Cursor'] = page['next_cursor']
+    return response
+
 @app.route('/api/breakup-messages/<message_type>', methods=['GET'])
 def get_breakup_messages(message_type) -> ResponseReturnValue:
-    import csv
-    import os
-    
     if message_type not in ['emoji', 'call', 'text']:
         return jsonify({'message': 'Invalid message type'}), 400
     
-    # Use absolute path for assets directory
-    assets_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
-    csv_file = os.path.join(assets_dir, f'breakup_{message_type}.csv')
-    
     try:
-        messages = []
-        with open(csv_file, 'r', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                # Handle both single-column and multi-column CSV files
-                content = row.get('content') or row.get('message') or list(row.values())[0]
-                tone = row.get('tone', 'classic')
-                message = {
-                    'content': content,
-                    'tone': tone
-                }
-                messages.append(message)
-        return jsonify(messages)
+        return catalog_response(f'breakup_{message_type}')
     except FileNotFoundError:
         return jsonify({'message': f'Failed to load {message_type} breakup messages'}), 404
     except Exception as e:
         app.logger.error(f'Error loading breakup messages: {str(e)}')
         return jsonify({'message': 'Error loading messages'}), 500
 
+# Recipients per bulk render request
+MAX_RENDER_RECIPIENTS = 10000
+
+@app.route('/api/templates', methods=['GET', 'POST'])
+@login_required
+def message_templates() -> ResponseReturnValue:
+    if request.method == 'GET':
+        return jsonify(db.get_message_templates(g.user_id))
+    
+    data = request.get_json()
+    if not data or 'title' not in data or 'content' not in data:
+        return jsonify({'message': 'Missing required fields'}), 400
+    
+    template, error = db.create_message_template(g.user_id, data['title'], data['content'],
+                                                 data.get('type', 'text'), data.get('tone'))
+    if error and error.startswith('Database error'):
+        app.logger.error(f'Error saving template: {error}')
+        return jsonify({'message': 'Failed to save template'}), 500
+    if error:
+        return jsonify({'message': error}), 400
+    return jsonify(template), 201
+
+@app.route('/api/templates/<int:template_id>', methods=['DELETE'])
+@login_required
+def delete_message_template(template_id) -> ResponseReturnValue:
+    if not db.delete_message_template(g.user_id, template_id):
+        return jsonify({'message': 'Template not found'}), 404
+    return jsonify({'message': 'Template deleted successfully'})
+
+@app.route('/api/messages/render', methods=['POST'])
+@login_required
+def render_messages() -> ResponseReturnValue:
+    """Render one template for many recipients, streamed as NDJSON.
+    
+    The body names the template (message_id for a built-in message,
+    template_id for one of the user's own, or inline content) and lists
+    recipients as objects of placeholder values: {"Name": "Alex"}.
+    """
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('recipients'), list):
+        return jsonify({'message': 'Missing recipients'}), 400
+    recipients = data['recipients']
+    if len(recipients) > MAX_RENDER_RECIPIENTS:
+        return jsonify({'message': f'At most {MAX_RENDER_RECIPIENTS} recipients per request'}), 400
+    
+    for field in ('message_id', 'template_id'):
+        value = data.get(field)
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool)):
+            return jsonify({'message': f'{field} must be an integer'}), 400
+    
+    try:
+        if data.get('message_id') is not None or data.get('template_id') is not None:
+            template, error = db.get_compiled_template(g.user_id, data.get('message_id'), data.get('template_id'))
+            if error:
+                return jsonify({'message': error}), 404
+        else:
+            template = templates.compile_template(data.get('content'))
+    except templates.TemplateError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    # Everything the stream needs is resolved above, so rendering holds no connection
+    return Response(templates.render_lines(template, recipients), mimetype='application/x-ndjson',
+                    headers={'X-Template-Variables': ','.join(template.variables)})
+
 @app.route('/api/user/social-platforms', methods=['GET', 'POST', 'DELETE'])
+@login_required
 def manage_social_platforms() -> ResponseReturnValue:
-    token_data = verify_token()
-    if not token_data:
-        return jsonify({'message': 'Invalid or expired token'}), 401
-    
-    user_id = token_data['user_id']
+    user_id = g.user_id
     
     try:
         if request.method == 'GET':
-            platforms = db.get_user_social_platforms(user_id)
-            if platforms is None:
-                return jsonify({'message': 'Failed to get social platforms'}), 500
-            return jsonify(platforms)
+            return user_list_response('social_platforms', user_id)
         
         if request.method == 'POST':
             data = request.get_json()
@@ -285,256 +520,271 @@ def manage_social_platforms() -> ResponseReturnValue:
         return jsonify({'message': 'Internal server error'}), 500
         
 @app.route('/api/user/rewards', methods=['GET'])
+@login_required
 def get_rewards() -> ResponseReturnValue:
-    token_data = verify_token()
-    if not token_data:
-        return jsonify({'message': 'Invalid or expired token'}), 401
-    
-    user_id = token_data['user_id']
-    user = db.get_user_by_id(user_id)
+    user_id = g.user_id
+    user = current_user()
     
     if not user:
         return jsonify({'message': 'User not found'}), 404
     
-    user_points = user['points']
+    # Get user's claimed rewards from database
+    claimed_rewards = db.get_user_claimed_rewards(user_id)
     
-    # Define available rewards
+    return jsonify(rewards_for(user['points'], claimed_rewards))
+
+def rewards_for(user_points, claimed_rewards) -> list:
+    """The reward list with unlocked/claimed flags for one user"""
     rewards = [
-        {
-            'id': 1,
-            'title': 'Digital Journal Theme',
-            'description': 'Unlock a premium journal theme',
-            'points': 100,
-            'unlocked': user_points >= 100
-        },
-        {
-            'id': 2,
-            'title': 'Custom Affirmations',
-            'description': 'Create and save your own affirmations',
-            'points': 200,
-            'unlocked': user_points >= 200
-        },
-        {
-            'id': 3,
-            'title': 'Advanced Analytics',
-            'description': 'Get detailed insights into your healing journey',
-            'points': 300,
-            'unlocked': user_points >= 300
-        },
-        {
-            'id': 4,
-            'title': 'Meditation Collection',
-            'description': 'Access premium guided meditations',
-            'points': 500,
-            'unlocked': user_points >= 500
-        },
+        {**reward, 'unlocked': user_points >= reward['points']}
+        for reward in db.get_reward_catalog()
     ]
     
-    # Get user's claimed rewards from database
-    claimed_rewards = db.get_user_claimed_rewards(user_id)
-    
     # Mark rewards as claimed if they are in the user's claimed rewards
     for reward in rewards:
         reward['claimed'] = reward['id'] in claimed_rewards
     
-    return jsonify(rewards)
+    return rewards
 
 @app.route('/api/user/rewards/claim', methods=['POST'])
+@login_required
 def claim_reward() -> ResponseReturnValue:
-    token_data = verify_token()
-    if not token_data:
-        return jsonify({'message': 'Invalid or expired token'}), 401
-    
     data = request.get_json()
     if not data or 'reward_id' not in data:
         return jsonify({'message': 'Missing reward_id'}), 400
     
-    user_id = token_data['user_id']
-    user = db.get_user_by_id(user_id)
-    
-    if not user:
-        return jsonify({'message': 'User not found'}), 404
-    
-    # Define reward point requirements
-    reward_points = {
-        1: 100,  # Digital Journal Theme
-        2: 200,  # Custom Affirmations
-        3: 300,  # Advanced Analytics
-        4: 500,  # Meditation Collection
-    }
-    
-    reward_id = data['reward_id']
-    
-    # Check if reward exists
-    if reward_id not in reward_points:
-        return jsonify({'message': 'Invalid reward ID'}), 400
-    
-    # Check if user has enough points
-    if user['points'] < reward_points[reward_id]:
-        return jsonify({'message': 'Not enough points to claim this reward'}), 400
-    
-    # Check if reward is already claimed
-    if db.is_reward_claimed(user_id, reward_id):
-        return jsonify({'message': 'Reward already claimed'}), 400
-    
-    # Add reward to user's claimed rewards
-    if db.claim_reward(user_id, reward_id):
-        return jsonify({
-            'message': 'Reward claimed successfully',
-            'rewards': db.get_user_claimed_rewards(user_id)
-        })
+    user_id = g.user_id
+    claimed_rewards, error = db.claim_reward(user_id, data['reward_id'])
+    if error == 'User not found':
+        return jsonify({'message': error}), 404
+    if error and error.startswith('Database error'):
+        app.logger.error(f'Error claiming reward: {error}')
+        return jsonify({'message': 'Failed to claim reward'}), 500
+    if error:
+        return jsonify({'message': error}), 400
     
-    return jsonify({'message': 'Failed to claim reward'}), 500
+    return jsonify({
+        'message': 'Reward claimed successfully',
+        'rewards': claimed_rewards
+    })
+
+@app.route('/api/user/rewards/claimed', methods=['GET'])
+@login_required
+def get_claimed_rewards() -> ResponseReturnValue:
+    return user_list_response('claimed_rewards', g.user_id)
+
+@app.route('/api/user/quiz-responses', methods=['GET'])
+@login_required
+def get_quiz_responses() -> ResponseReturnValue:
+    return user_list_response('quiz_responses', g.user_id)
 
 @app.route('/api/user/achievements', methods=['GET'])
+@login_required
 def get_achievements() -> ResponseReturnValue:
-    token_data = verify_token()
-    if not token_data:
-        return jsonify({'message': 'Invalid or expired token'}), 401
+    user_id = g.user_id
     
-    user_id = token_data['user_id']
-    user = db.get_user_by_id(user_id)
-    
-    if not user:
-        return jsonify({'message': 'User not found'}), 404
-    
-    # Get user data for achievement calculations
-    user_streak = user.get('streak', 0)
-    user_days_strong = user.get('days_strong', 0)
-    ghost_mode_days = db.get_ghost_mode_days(user_id)
-    
-    # Get completed achievements with dates
-    completed_achievements = db.get_user_achievements(user_id)
+    # Achievements are awarded when their counters change, so this is a pure read
+    return jsonify(achievements_for(db.get_user_achievements(user_id)))
+
+def achievements_for(completed_achievements) -> list:
+    """The full achievement catalog with one user's completion state"""
     completed_ids = {ach['achievement_id']: ach['completed_at'] for ach in completed_achievements}
-    
-    # Define achievements and check if they're completed
-    achievements = [
-        {
-            'id': 1,
-            'title': '7-Day Streak',
-            'description': 'Logged in for 7 consecutive days',
-            'points': 50,
-            'completed': user_streak >= 7,
-            'completed_at': completed_ids.get(1)
-        },
+    return [
         {
-            'id': 2,
-            'title': '30-Day Journey',
-            'description': 'Reached 30 days in your healing journey',
-            'points': 100,
-            'completed': user_days_strong >= 30,
-            'completed_at': completed_ids.get(2)
-        },
-        {
-            'id': 3,
-            'title': 'Ghost Mode Master',
-            'description': 'Used Ghost Mode features for 30 days',
-            'points': 150,
-            'completed': ghost_mode_days >= 30,
-            'completed_at': completed_ids.get(3)
-        },
+            **achievements.describe(achievement),
+            'completed': achievement['id'] in completed_ids,
+            'completed_at': completed_ids.get(achievement['id'])
+        }
+        for achievement in achievements.ACHIEVEMENTS
     ]
-    
-    # Check for newly completed achievements and save them
-    for achievement in achievements:
-        if achievement['completed'] and not achievement['completed_at']:
-            db.save_achievement(user_id, achievement['id'])
-            # Update points
-            db.update_user_points(user_id, achievement['points'])
-    
-    return jsonify(achievements)
 
 @app.route('/api/user/recent-achievements', methods=['GET'])
+@login_required
 def get_recent_achievements() -> ResponseReturnValue:
-    token_data = verify_token()
-    if not token_data:
-        return jsonify({'message': 'Invalid or expired token'}), 401
-    
-    user_id = token_data['user_id']
-    completed_achievements = db.get_user_achievements(user_id)
-    
-    # Get all achievements to map IDs to full achievement data
-    all_achievements = [
-        {
-            'id': 1,
-            'title': '7-Day Streak',
-            'description': 'Logged in for 7 consecutive days',
-            'points': 50
-        },
-        {
-            'id': 2,
-            'title': '30-Day Journey',
-            'description': 'Reached 30 days in your healing journey',
-            'points': 100
-        },
-        {
-            'id': 3,
-            'title': 'Ghost Mode Master',
-            'description': 'Used Ghost Mode features for 30 days',
-            'points': 150
-        },
-    ]
-    
-    achievement_map = {ach['id']: ach for ach in all_achievements}
-    
-    # Combine completion dates with achievement details and sort by completion date
+    return user_list_response('achievements', g.user_id, recent_achievements_for)
+
+def recent_achievements_for(completed_achievements) -> list:
+    """Completed achievements with their details, most recent first"""
+    # Combine completion dates with achievement details (already most recent first)
     recent_achievements = []
     for completed in completed_achievements:
-        achievement = achievement_map.get(completed['achievement_id'])
+        achievement = achievements.ACHIEVEMENTS_BY_ID.get(completed['achievement_id'])
         if achievement:
             recent_achievements.append({
-                **achievement,
+                **achievements.describe(achievement),
                 'completed_at': completed['completed_at']
             })
     
-    # Sort achievements by completion date, most recent first
-    recent_achievements.sort(key=lambda x: x['completed_at'], reverse=True)
+    return recent_achievements
+
+@app.route('/api/leaderboard', methods=['GET'])
+@login_required
+def get_leaderboard() -> ResponseReturnValue:
+    page, error = db.get_leaderboard(request.args.get('limit', 10, type=int),
+                                     request.args.get('cursor'))
+    if error and error.startswith('Database error'):
+        app.logger.error(f'Error loading leaderboard: {error}')
+        return jsonify({'message': 'Failed to load leaderboard'}), 500
+    if error:
+        return jsonify({'message': error}), 400
+    return page_response(page)
+
+@app.route('/api/leaderboard/me', methods=['GET'])
+@login_required
+def get_my_rank() -> ResponseReturnValue:
+    window = request.args.get('window', 5, type=int)
+    if not 0 <= window <= db.LEADERBOARD_MAX_WINDOW:
+        return jsonify({'message': f'window must be between 0 and {db.LEADERBOARD_MAX_WINDOW}'}), 400
+    
+    rank = db.get_user_rank(g.user_id, window)
+    if rank is None:
+        return jsonify({'message': 'User not found'}), 404
+    return jsonify(rank)
+
+@app.route('/api/user/dashboard', methods=['GET'])
+@login_required
+def get_dashboard() -> ResponseReturnValue:
+    sections, error = dashboard_sections(request.args.get('fields'))
+    if error:
+        return jsonify({'message': error}), 400
+    
+    data, error = db.get_dashboard(g.user_id, sections)
+    if error == 'User not found':
+        return jsonify({'message': error}), 404
+    if error:
+        return jsonify({'message': 'Failed to load dashboard'}), 500
     
-    return jsonify(recent_achievements)
+    return jsonify(dashboard_payload(data, sections))
+
+def dashboard_sections(fields) -> tuple:
+    """Parse ?fields=a,b into the requested sections (all of them by default)"""
+    if not fields:
+        return list(db.DASHBOARD_SECTIONS), None
+    sections = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in sections if field not in db.DASHBOARD_SECTIONS]
+    if unknown or not sections:
+        return None, f"Unknown dashboard fields: {', '.join(unknown)}. Valid fields: {', '.join(db.DASHBOARD_SECTIONS)}"
+    return sections, None
+
+def dashboard_payload(data, sections) -> dict:
+    """Dashboard sections in the same shapes as their standalone endpoints"""
+    payload = {}
+    for section in sections:
+        if section == 'rewards':
+            payload[section] = rewards_for(data['user']['points'], data['claimed_rewards'])
+        elif section == 'achievements':
+            payload[section] = achievements_for(data['achievements'])
+        elif section == 'recentAchievements':
+            payload[section] = recent_achievements_for(data['achievements'])
+        elif section == 'ghostModeDays':
+            payload[section] = {'days': data['ghost_mode_days']}
+        elif section == 'ghostModeSettings':
+            payload[section] = ghost_settings_payload(data['ghost_mode_settings'])
+        elif section == 'socialPlatforms':
+            payload[section] = data['social_platforms']
+    return payload
 
 @app.route('/api/quiz/magic', methods=['GET'])
 def get_magic_quiz() -> ResponseReturnValue:
     try:
-        import csv
-        
-        # Use absolute path for assets directory
-        assets_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
-        csv_file = os.path.join(assets_dir, 'magic_quiz.csv')
-        
-        questions = []
-        with open(csv_file, 'r', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                question = {
-                    'question': row['Question'],
-                    'options': [
-                        row['Option1'],
-                        row['Option2'],
-                        row['Option3'],
-                        row['Option4']
-                    ]
-                }
-                questions.append(question)
-        
-        return jsonify(questions)
+        return catalog_response('magic_quiz')
     except FileNotFoundError:
         return jsonify({'message': 'Quiz questions not found'}), 404
     except Exception as e:
         app.logger.error(f'Error loading quiz questions: {str(e)}')
         return jsonify({'message': 'Error loading quiz questions'}), 500
 
+# Submissions scored per request
+MAX_QUIZ_SUBMISSIONS = 10000
+
+# The scoring engine for the current magic_quiz.csv, rebuilt when its ETag changes
+quiz_recommenders = TTLCache(maxsize=4, ttl=86400)
+
+def quiz_recommender() -> QuizRecommender:
+    entry = catalog.get('magic_quiz')
+    engine = quiz_recommenders.get(entry.etag)
+    if engine is None:
+        engine = QuizRecommender(entry.data)
+        quiz_recommenders.set(entry.etag, engine)
+    return engine
+
+@app.route('/api/quiz/magic/recommend', methods=['POST'])
+def recommend_breakup_method() -> ResponseReturnValue:
+    """Score quiz answers: {"answers": [...]} for one submission, {"submissions": [[...], ...]} for many.
+    
+    An answer is an option index, the option's text, or null if skipped.
+    """
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('answers', data.get('submissions')), list):
+        return jsonify({'message': 'Missing answers'}), 400
+    single = 'answers' in data
+    submissions = [data['answers']] if single else data['submissions']
+    if len(submissions) > MAX_QUIZ_SUBMISSIONS:
+        return jsonify({'message': f'At most {MAX_QUIZ_SUBMISSIONS} submissions per request'}), 400
+    
+    try:
+        recommendations = quiz_recommender().recommend(submissions)
+    except RecommendationError as e:
+        return jsonify({'message': str(e)}), 400
+    except FileNotFoundError:
+        return jsonify({'message': 'Quiz questions not found'}), 404
+    return jsonify(recommendations[0] if single else {'recommendations': recommendations})
+
+@app.route('/api/quiz/magic/submit', methods=['POST'])
+@login_required
+def submit_magic_quiz() -> ResponseReturnValue:
+    """Save a complete quiz run in one transaction and return its recommendation.
+    
+    Takes {"answers": [...]} like /recommend, plus an optional submission_id
+    that makes retries idempotent: resending the same answers replays the
+    stored run (200), different answers under that id are a 409.
+    """
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('answers'), list):
+        return jsonify({'message': 'Missing answers'}), 400
+    
+    try:
+        engine = quiz_recommender()
+        answers = engine.encode_submission(data['answers'], allow_skipped=False)
+    except RecommendationError as e:
+        return jsonify({'message': str(e)}), 400
+    except FileNotFoundError:
+        return jsonify({'message': 'Quiz questions not found'}), 404
+    
+    responses = [(number, question['options'][option])
+                 for number, (question, option) in enumerate(zip(engine.questions, answers), 1)]
+    submission, error = db.save_quiz_submission(g.user_id, responses, data.get('submission_id'))
+    if error and error.startswith('Database error'):
+        app.logger.error(f'Error saving quiz submission: {error}')
+        return jsonify({'message': 'Failed to save quiz answers'}), 500
+    if error == 'Submission already exists':
+        return jsonify({'message': 'This submission_id was already used for different answers'}), 409
+    if error:
+        return jsonify({'message': error}), 400
+    
+    # A replay answers from the stored run, exactly as the first request did
+    stored = [response for _, response in submission['responses']]
+    try:
+        recommendation = engine.recommend([stored])[0]
+    except RecommendationError:
+        # The quiz was edited since this run was stored, so it cannot be scored again
+        return jsonify({'message': 'This submission_id belongs to an earlier version of the quiz'}), 409
+    return jsonify({
+        'message': 'Quiz submitted successfully',
+        'submission_id': submission['submission_id'],
+        'answers': stored,
+        'recommendation': recommendation
+    }), 200 if submission['replayed'] else 201
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve_frontend(path) -> ResponseReturnValue:
     try:
-        # First try to serve static files from public directory
-        if path and os.path.exists(os.path.join('public', path)):
-            return send_from_directory('public', path)
-        # For assets, try to serve from public/assets
-        if path.startswith('assets/') and os.path.exists(os.path.join('public', path)):
-            return send_from_directory('public', path)
-        # For all other routes, serve index.html from public directory
-        return send_from_directory('public', 'index.html')
+        # Files in public/ are served from the manifest; any other route gets index.html
+        response = static_files.response(path, request)
+        if response is None:
+            return 'Not Found', 404
+        return response
     except Exception as e:
         app.logger.error(f'Error serving frontend: {str(e)}')
         return 'Internal Server Error', 500
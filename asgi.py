@@ -0,0 +1,363 @@
+"""ASGI entry point for the asyncio API mode.
+
+The hot /api routes are served by native async views built on async_db and
+the password pool's async API, so one process can hold thousands of
+keep-alive clients while SQLite work runs on a bounded executor. Every other
+request (remaining writes, /metrics, CORS preflights, the frontend) is handed
+to the Flask app unchanged.
+
+    pip install -r requirements-async.txt
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import json
+import time
+from urllib.parse import parse_qs
+
+from werkzeug.http import parse_accept_header
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError as e:
+    raise ImportError('The async API mode needs the packages in requirements-async.txt') from e
+
+import app as web
+import async_db
+import compression
+import passwords
+from metrics import metrics
+
+class Request:
+    """The parts of an ASGI HTTP request the async views need"""
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.headers = {key.decode('latin-1').lower(): value.decode('latin-1')
+                        for key, value in scope.get('headers', [])}
+        self.args = {key: values[-1] for key, values in
+                     parse_qs(scope.get('query_string', b'').decode('latin-1')).items()}
+        self.body = body
+
+    def get_json(self):
+        if not self.body:
+            return None
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            return None
+
+class Response:
+    def __init__(self, body=b'', status=200, content_type='application/json', headers=None):
+        self.body = body
+        self.status = status
+        self.headers = {'Content-Type': content_type, 'Access-Control-Allow-Origin': '*',
+                        'Access-Control-Expose-Headers': 'X-Next-Cursor'}
+        self.headers.update(headers or {})
+
+def jsonify(payload, status=200, headers=None):
+    return Response(json.dumps(payload).encode('utf-8'), status, headers=headers)
+
+def busy_response(retry_after):
+    return jsonify({'message': 'Server is busy, please try again shortly'}, 503,
+                   {'Retry-After': str(retry_after)})
+
+def rejected_response(rejection):
+    if rejection.status == 503:
+        return busy_response(rejection.retry_after)
+    return jsonify({'message': 'Too many requests, please slow down'}, 429,
+                   {'Retry-After': str(rejection.retry_after)})
+
+def catalog_response(request, name):
+    """Async twin of app.catalog_response (pre-encoded body, ETag/304)"""
+    entry = web.catalog.get(name)
+    etag = f'"{entry.etag}"'
+    headers = {'ETag': etag, 'Cache-Control': 'public, no-cache'}
+    candidates = [tag.strip().removeprefix('W/') for tag in request.headers.get('if-none-match', '').split(',')]
+    if etag in candidates or '*' in candidates:
+        return Response(status=304, headers=headers)
+    return Response(entry.body, headers=headers)
+
+def compress(request, response):
+    """Apply compression.py's policy to a native view's response"""
+    if (response.status != 200 or 'Content-Encoding' in response.headers
+            or not response.headers['Content-Type'].startswith(compression.COMPRESSIBLE_TYPES)):
+        return response
+    response.headers['Vary'] = 'Accept-Encoding'
+    encoding = compression.negotiate(parse_accept_header(request.headers.get('accept-encoding')))
+    if encoding is None or len(response.body) < compression.MIN_SIZE:
+        return response
+
+    etag = response.headers.get('ETag')
+    if compression.is_shared(response.headers.get('Cache-Control', ''), etag):
+        response.body = compression.cached_compress(etag.strip('"'), response.body, encoding)
+        response.headers['ETag'] = f'W/{etag}'
+    else:
+        response.body = compression.compress(response.body, encoding)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+# Native routes: path template -> {method: (view, requires auth)}
+ROUTES = {}
+
+def route(template, methods=('GET',), auth=False):
+    def register(view):
+        for method in methods:
+            ROUTES.setdefault(template, {})[method] = (view, auth)
+        return view
+    return register
+
+def match(path):
+    """Find the template matching a path, returning (template, params)"""
+    if path in ROUTES:
+        return path, {}
+    segments = path.strip('/').split('/')
+    for template in ROUTES:
+        parts = template.strip('/').split('/')
+        if len(parts) != len(segments):
+            continue
+        params = {}
+        for part, segment in zip(parts, segments):
+            if part.startswith('<') and part.endswith('>'):
+                params[part[1:-1]] = segment
+            elif part != segment:
+                break
+        else:
+            return template, params
+    return None, None
+
+@route('/api/login', ['POST'])
+async def login(request):
+    data = request.get_json()
+    if not data or not data.get('email') or not data.get('password'):
+        return jsonify({'message': 'Missing email or password'}, 400)
+
+    user = await async_db.get_user_credentials(data['email'])
+    try:
+        if not user or not await passwords.verify_password_async(user['password'], data['password']):
+            return jsonify({'message': 'Invalid credentials'}, 401)
+
+        # Transparently upgrade hashes made with older KDF parameters
+        if passwords.needs_rehash(user['password']):
+            new_hash = await passwords.hash_password_async(data['password'])
+            await async_db.update_user_password(user['id'], new_hash)
+    except passwords.PoolSaturated as e:
+        return busy_response(e.retry_after)
+
+    return jsonify(web.login_payload(user))
+
+@route('/api/register', ['POST'])
+async def register(request):
+    data = request.get_json()
+    if not data or not data.get('email') or not data.get('password') or not data.get('username'):
+        return jsonify({'message': 'Missing required fields'}, 400)
+
+    if await async_db.get_user_by_email(data['email']):
+        return jsonify({'message': 'User already exists'}, 400)
+    try:
+        password_hash = await passwords.hash_password_async(data['password'])
+    except passwords.PoolSaturated as e:
+        return busy_response(e.retry_after)
+
+    user, error = await async_db.create_user(data['username'], data['email'], data['password'],
+                                             password_hash=password_hash)
+    if error:
+        return jsonify({'message': error}, 400)
+    if not user:
+        return jsonify({'message': 'Failed to create user. Please try again.'}, 500)
+    return jsonify({'message': 'User registered successfully'}, 201)
+
+@route('/api/user/update-points', ['POST'], auth=True)
+async def update_points(request, user_id):
+    data = request.get_json()
+    if not data or 'points' not in data:
+        return jsonify({'message': 'Missing required fields'}, 400)
+    if not isinstance(data['points'], int) or isinstance(data['points'], bool):
+        return jsonify({'message': 'Points must be an integer'}, 400)
+
+    result, error = await async_db.update_user_points(user_id, data['points'])
+    if error:
+        return jsonify({'message': error}, 500)
+    if not result:
+        return jsonify({'message': 'Failed to update points'}, 500)
+
+    return jsonify({
+        'message': 'Points updated successfully',
+        'points': result['points'],
+        'streak': result['streak'],
+        'days_strong': result['days_strong']
+    })
+
+@route('/api/user/ghost-mode/settings', ['GET'], auth=True)
+async def ghost_mode_settings(request, user_id):
+    settings = await async_db.get_ghost_mode_settings(user_id)
+    if settings is None:
+        return jsonify({'message': 'Failed to retrieve ghost mode settings'}, 500)
+
+    return jsonify(web.ghost_settings_payload(settings))
+
+@route('/api/user/ghost-mode/days', ['GET'], auth=True)
+async def ghost_mode_days(request, user_id):
+    days = await async_db.get_ghost_mode_days(user_id)
+    if days is None:
+        return jsonify({'message': 'Failed to get ghost mode days'}, 500)
+    return jsonify({'days': days})
+
+async def user_list_response(request, name, user_id, transform=None):
+    """Async twin of app.user_list_response"""
+    try:
+        limit = int(request.args.get('limit', web.db.USER_LIST_DEFAULT_LIMIT))
+    except ValueError:
+        limit = web.db.USER_LIST_DEFAULT_LIMIT
+    page, error = await async_db.get_user_list_page(name, user_id, limit, request.args.get('cursor'))
+    if error and error.startswith('Database error'):
+        web.app.logger.error(f'Error loading {name}: {error}')
+        return jsonify({'message': 'Internal server error'}, 500)
+    if error:
+        return jsonify({'message': error}, 400)
+    if transform:
+        page['items'] = transform(page['items'])
+    return page_response(page)
+
+@route('/api/user/social-platforms', ['GET'], auth=True)
+async def social_platforms(request, user_id):
+    return await user_list_response(request, 'social_platforms', user_id)
+
+@route('/api/user/rewards', ['GET'], auth=True)
+async def rewards(request, user_id):
+    user, claimed = await asyncio.gather(async_db.get_user_by_id(user_id),
+                                         async_db.get_user_claimed_rewards(user_id))
+    if not user:
+        return jsonify({'message': 'User not found'}, 404)
+    return jsonify(web.rewards_for(user['points'], claimed))
+
+@route('/api/user/achievements', ['GET'], auth=True)
+async def user_achievements(request, user_id):
+    return jsonify(web.achievements_for(await async_db.get_user_achievements(user_id)))
+
+@route('/api/user/recent-achievements', ['GET'], auth=True)
+async def recent_achievements(request, user_id):
+    return await user_list_response(request, 'achievements', user_id, web.recent_achievements_for)
+
+@route('/api/user/dashboard', auth=True)
+async def dashboard(request, user_id):
+    sections, error = web.dashboard_sections(request.args.get('fields'))
+    if error:
+        return jsonify({'message': error}, 400)
+
+    data, error = await async_db.get_dashboard(user_id, sections)
+    if error == 'User not found':
+        return jsonify({'message': error}, 404)
+    if error:
+        return jsonify({'message': 'Failed to load dashboard'}, 500)
+
+    return jsonify(web.dashboard_payload(data, sections))
+
+@route('/api/breakup-messages')
+async def search_breakup_messages(request):
+    message_type = request.args.get('type')
+    if message_type and message_type not in ['emoji', 'call', 'text']:
+        return jsonify({'message': 'Invalid message type'}, 400)
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        limit = 20
+    page, error = await async_db.search_breakup_messages(request.args.get('q'), message_type,
+                                                         request.args.get('tone'), limit, request.args.get('cursor'))
+    if error and error.startswith('Database error'):
+        web.app.logger.error(f'Error searching breakup messages: {error}')
+        return jsonify({'message': 'Error loading messages'}, 500)
+    if error:
+        return jsonify({'message': error}, 400)
+    return page_response(page)
+
+def page_response(page):
+    headers = {'X-Next-Cursor': page['next_cursor']} if page['next_cursor'] else None
+    return jsonify(page['items'], headers=headers)
+
+@route('/api/breakup-messages/<message_type>')
+async def breakup_messages(request, message_type):
+    if message_type not in ['emoji', 'call', 'text']:
+        return jsonify({'message': 'Invalid message type'}, 400)
+    try:
+        return catalog_response(request, f'breakup_{message_type}')
+    except FileNotFoundError:
+        return jsonify({'message': f'Failed to load {message_type} breakup messages'}, 404)
+
+@route('/api/quiz/magic')
+async def magic_quiz(request):
+    try:
+        return catalog_response(request, 'magic_quiz')
+    except FileNotFoundError:
+        return jsonify({'message': 'Quiz questions not found'}, 404)
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+async def send_response(send, response):
+    headers = [(key.lower().encode('latin-1'), str(value).encode('latin-1'))
+               for key, value in response.headers.items()]
+    headers.append((b'content-length', str(len(response.body)).encode('latin-1')))
+    await send({'type': 'http.response.start', 'status': response.status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': response.body})
+
+async def dispatch(scope, receive, send, template, params):
+    started = time.perf_counter()
+    request = Request(scope, await read_body(receive))
+    view, auth = ROUTES[template][request.method]
+    token_data = web.verify_authorization(request.headers.get('authorization'))
+    client = scope.get('client') or (None, None)
+    ip = web.client_ip(client[0], request.headers.get('x-forwarded-for'))
+    rejection = web.admission.admit(template, request.method, ip, token_data['user_id'] if token_data else None)
+    if rejection:
+        response = rejected_response(rejection)
+        await send_response(send, response)
+        metrics.observe_request(template, request.method, response.status, time.perf_counter() - started)
+        return
+
+    try:
+        if auth:
+            if not token_data:
+                response = jsonify({'message': 'Invalid or expired token'}, 401)
+            else:
+                response = await view(request, token_data['user_id'], **params)
+        else:
+            response = await view(request, **params)
+    except Exception as e:
+        web.app.logger.error(f'Error handling {request.method} {request.path}: {str(e)}')
+        response = jsonify({'message': 'Internal server error'}, 500)
+    finally:
+        web.admission.release(time.perf_counter() - started)
+
+    await send_response(send, compress(request, response))
+    metrics.observe_request(template, request.method, response.status, time.perf_counter() - started)
+
+flask_app = WsgiToAsgi(web.app)
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await asyncio.get_running_loop().run_in_executor(None, async_db.shutdown)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+
+    if scope['type'] == 'http':
+        template, params = match(scope['path'])
+        if template is not None and scope['method'] in ROUTES[template]:
+            return await dispatch(scope, receive, send, template, params)
+
+    return await flask_app(scope, receive, send)
@@ -0,0 +1,70 @@
+"""Asyncio front-end for database.py.
+
+Every coroutine here runs the matching database.py function on a dedicated
+thread pool. Connections are pooled per thread, so the pool size is also the
+upper bound on open SQLite connections, and the event loop never blocks on
+SQLite I/O.
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import database as db
+
+DB_THREADS = int(os.environ.get('CRUMBLE_ASYNC_DB_THREADS', '8'))
+
+_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix='crumble-db')
+
+async def run(fn, *args, **kwargs):
+    """Run any blocking callable on the database executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+def _wrap(fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run(fn, *args, **kwargs)
+    return wrapper
+
+def shutdown():
+    """Flush buffered writes and stop the executor (call on server shutdown)"""
+    def close():
+        db.ghost_mode_log.flush()
+        db.close_db()
+    _executor.submit(close).result()
+    _executor.shutdown(wait=True)
+
+# Async versions of the data-layer API
+get_user_by_email = _wrap(db.get_user_by_email)
+get_user_by_id = _wrap(db.get_user_by_id)
+get_user_credentials = _wrap(db.get_user_credentials)
+create_user = _wrap(db.create_user)
+update_user_password = _wrap(db.update_user_password)
+update_user_points = _wrap(db.update_user_points)
+get_breakup_messages = _wrap(db.get_breakup_messages)
+search_breakup_messages = _wrap(db.search_breakup_messages)
+get_user_list_page = _wrap(db.get_user_list_page)
+get_message_templates = _wrap(db.get_message_templates)
+create_message_template = _wrap(db.create_message_template)
+delete_message_template = _wrap(db.delete_message_template)
+get_compiled_template = _wrap(db.get_compiled_template)
+save_quiz_response = _wrap(db.save_quiz_response)
+save_quiz_submission = _wrap(db.save_quiz_submission)
+get_user_quiz_responses = _wrap(db.get_user_quiz_responses)
+get_user_rewards = _wrap(db.get_user_rewards)
+claim_reward = _wrap(db.claim_reward)
+get_ghost_mode_settings = _wrap(db.get_ghost_mode_settings)
+update_ghost_mode_settings = _wrap(db.update_ghost_mode_settings)
+get_user_social_platforms = _wrap(db.get_user_social_platforms)
+add_social_platform = _wrap(db.add_social_platform)
+remove_social_platform = _wrap(db.remove_social_platform)
+log_ghost_mode_activity = _wrap(db.log_ghost_mode_activity)
+get_ghost_mode_days = _wrap(db.get_ghost_mode_days)
+get_user_achievements = _wrap(db.get_user_achievements)
+save_achievement = _wrap(db.save_achievement)
+get_user_claimed_rewards = _wrap(db.get_user_claimed_rewards)
+is_reward_claimed = _wrap(db.is_reward_claimed)
+get_dashboard = _wrap(db.get_dashboard)
+get_leaderboard = _wrap(db.get_leaderboard)
+get_user_rank = _wrap(db.get_user_rank)
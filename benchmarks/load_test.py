@@ -0,0 +1,380 @@
+"""HTTP load test and latency benchmark for every /api route.
+
+Seeds a throwaway SQLite database, serves app.py from a local threaded
+server, and drives a weighted mix of requests from concurrent clients over
+keep-alive connections. Reports throughput and p50/p95/p99 latency per
+route, writes them to JSON, and can fail the run when it regresses against
+a previous result file.
+
+    python benchmarks/load_test.py --concurrency 16 --duration 20 --output run.json
+    python benchmarks/load_test.py --baseline run.json --max-regression 0.15
+    python benchmarks/load_test.py --mix rewards=5,update_points=2,login=1
+"""
+import argparse
+import functools
+import http.client
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog
+import database as db
+
+SEED_PASSWORD = 'benchmark-password'
+
+# Route name -> (weight, request builder). Builders take the client state and
+# return (method, path, json body or None, whether to send the auth token), or
+# None when the request cannot succeed from the client's current state (the
+# draw is then skipped). They draw from client.rng so a --seed replays the
+# same requests.
+def _register(client):
+    email = f'new-{client.index}-{next(client.counter)}-{client.rng.getrandbits(32)}@bench.local'
+    return 'POST', '/api/register', {'username': 'bench', 'email': email, 'password': SEED_PASSWORD}, False
+
+def _login(client):
+    return 'POST', '/api/login', {'email': client.email, 'password': SEED_PASSWORD}, False
+
+def _ghost_settings_update(client):
+    enabled = client.rng.random() < 0.5
+    settings = {
+        'blockMessages': enabled,
+        'hideStatus': False,
+        'muteNotifications': enabled,
+        'hideActivity': False
+    }
+    return 'POST', '/api/user/ghost-mode/settings', {'settings': settings}, True
+
+SOCIAL_PLATFORMS = ('Instagram', 'LinkedIn', 'TikTok', 'Snapchat')
+
+# Connecting twice or disconnecting a platform that is not connected is an
+# error, so each client only toggles the platforms it knows the state of. The
+# names carry the client index because several clients may share an account.
+def _social_connect(client):
+    names = sorted(set(SOCIAL_PLATFORMS) - client.platforms)
+    if not names:
+        return None
+    name = client.rng.choice(names)
+    client.platforms.add(name)
+    return 'POST', '/api/user/social-platforms', {'platform': {'name': f'{name} {client.index}', 'username': 'bench'}}, True
+
+def _social_disconnect(client):
+    if not client.platforms:
+        return None
+    name = client.rng.choice(sorted(client.platforms))
+    client.platforms.discard(name)
+    return 'DELETE', '/api/user/social-platforms', {'platform_name': f'{name} {client.index}'}, True
+
+def _render(client):
+    recipients = [{'Name': f'friend{i}'} for i in range(100)]
+    return 'POST', '/api/messages/render', {'content': 'Hi [Name], we need to talk.', 'recipients': recipients}, True
+
+def _template_create(client):
+    return 'POST', '/api/templates', {'title': 'bench', 'content': 'Dear [Name], it is over.'}, True
+
+def _search(client):
+    return 'GET', f"/api/breakup-messages?q={client.rng.choice(['sorry', 'over', 'time', 'we'])}&limit=20", None, False
+
+@functools.lru_cache(maxsize=None)
+def _quiz_option_counts():
+    with open(os.path.join(catalog.ASSETS_DIR, 'magic_quiz.csv'), newline='', encoding='utf-8') as file:
+        return tuple(len(question['options']) for question in catalog.parse_magic_quiz(file))
+
+def _quiz_answers(rng):
+    return [rng.randrange(count) for count in _quiz_option_counts()]
+
+def _quiz_recommend(client):
+    return 'POST', '/api/quiz/magic/recommend', {'answers': _quiz_answers(client.rng)}, False
+
+def _quiz_submit(client):
+    submission_id = f'bench-{client.index}-{next(client.counter)}'
+    return 'POST', '/api/quiz/magic/submit', {'answers': _quiz_answers(client.rng), 'submission_id': submission_id}, True
+
+ROUTES = {
+    'register': (1, _register),
+    'login': (2, _login),
+    'update_points': (6, lambda c: ('POST', '/api/user/update-points', {'points': 5}, True)),
+    'rewards': (8, lambda c: ('GET', '/api/user/rewards', None, True)),
+    'claim_reward': (2, lambda c: ('POST', '/api/user/rewards/claim', {'reward_id': c.rng.randint(1, 4)}, True)),
+    'achievements': (8, lambda c: ('GET', '/api/user/achievements', None, True)),
+    'recent_achievements': (4, lambda c: ('GET', '/api/user/recent-achievements', None, True)),
+    'ghost_settings': (4, lambda c: ('GET', '/api/user/ghost-mode/settings', None, True)),
+    'ghost_settings_update': (2, _ghost_settings_update),
+    'ghost_days': (4, lambda c: ('GET', '/api/user/ghost-mode/days', None, True)),
+    'social_platforms': (4, lambda c: ('GET', '/api/user/social-platforms', None, True)),
+    'dashboard': (4, lambda c: ('GET', '/api/user/dashboard', None, True)),
+    'social_connect': (1, _social_connect),
+    'social_disconnect': (1, _social_disconnect),
+    'breakup_messages': (10, lambda c: ('GET', f"/api/breakup-messages/{c.rng.choice(['emoji', 'call', 'text'])}", None, False)),
+    'magic_quiz': (6, lambda c: ('GET', '/api/quiz/magic', None, False)),
+    'leaderboard': (6, lambda c: ('GET', '/api/leaderboard?limit=20', None, True)),
+    'leaderboard_me': (4, lambda c: ('GET', '/api/leaderboard/me', None, True)),
+    'templates': (3, lambda c: ('GET', '/api/templates', None, True)),
+    'template_create': (1, _template_create),
+    'render': (2, _render),
+    'search': (6, _search),
+    'quiz_recommend': (4, _quiz_recommend),
+    'quiz_submit': (2, _quiz_submit),
+    'claimed_rewards': (3, lambda c: ('GET', '/api/user/rewards/claimed', None, True)),
+    'quiz_responses': (3, lambda c: ('GET', '/api/user/quiz-responses', None, True)),
+}
+
+def parse_mix(text):
+    """Parse 'name=weight,...' into {name: weight}, defaulting to ROUTES weights"""
+    if not text:
+        return {name: weight for name, (weight, _) in ROUTES.items()}
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ROUTES:
+            raise SystemExit(f"Unknown route '{name}'. Known routes: {', '.join(ROUTES)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+def seed_database(path, users):
+    """Create a fresh database with `users` login-ready accounts"""
+    db.DATABASE_PATH = path
+    # Not init_db(): that would also import any users.json in the working directory
+    db.migrate()
+    db.add_default_breakup_messages()
+    password_hash = db.passwords.hash_password(SEED_PASSWORD)
+    with db.get_db() as conn:
+        conn.executemany('''
+        INSERT INTO users (username, email, password, points, streak, days_strong)
+        VALUES (?, ?, ?, ?, 0, 0)
+        ''', [(f'bench{i}', f'bench{i}@bench.local', password_hash, random.randint(0, 600)) for i in range(users)])
+        conn.execute('''
+        INSERT OR IGNORE INTO ghost_mode_settings (user_id) SELECT id FROM users
+        ''')
+
+def start_server(throttle=False):
+    """Serve app.py on an ephemeral port from a background thread"""
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    import app as app_module
+
+    class KeepAliveHandler(WSGIRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_request(self, *args, **kwargs):
+            pass
+
+    if not throttle:
+        # Every simulated client shares 127.0.0.1, so lift the per-client limits
+        app_module.admission.ip_buckets.rate = app_module.admission.ip_buckets.burst = 1e9
+        app_module.admission.user_buckets.rate = app_module.admission.user_buckets.burst = 1e9
+
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True, request_handler=KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+class Client:
+    """One simulated user with its own keep-alive connection"""
+    def __init__(self, index, port, email, seed=0):
+        self.index = index
+        self.port = port
+        self.email = email
+        self.token = None
+        self.counter = itertools.count()
+        self.rng = random.Random(f'{seed}:{index}')
+        # Social platforms this client has connected
+        self.platforms = set()
+        self.conn = None
+
+    def request(self, method, path, body=None, auth=False):
+        headers = {'Content-Type': 'application/json'}
+        if auth and self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        payload = json.dumps(body).encode('utf-8') if body is not None else None
+
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+            try:
+                self.conn.request(method, path, body=payload, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                if response.getheader('Connection', '').lower() == 'close':
+                    self.conn.close()
+                    self.conn = None
+                return response.status, data
+            except (http.client.HTTPException, OSError):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+    def login(self):
+        status, data = self.request('POST', '/api/login', {'email': self.email, 'password': SEED_PASSWORD})
+        if status != 200:
+            raise RuntimeError(f'Seed login failed for {self.email}: {status} {data[:200]!r}')
+        self.token = json.loads(data)['token']
+
+def run_load(port, mix, concurrency, duration, max_requests, seeded_users, seed=0):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    samples = {name: [] for name in names}
+    statuses = {name: {} for name in names}
+    failures = {name: 0 for name in names}
+    lock = threading.Lock()
+    remaining = itertools.count()
+
+    clients = [Client(i, port, f'bench{i % seeded_users}@bench.local', seed) for i in range(concurrency)]
+    for client in clients:
+        client.login()
+    stop_at = time.perf_counter() + duration
+
+    def worker(client):
+        local = []
+        while time.perf_counter() < stop_at:
+            name = client.rng.choices(names, weights)[0]
+            request = ROUTES[name][1](client)
+            if request is None:
+                continue
+            if max_requests and next(remaining) >= max_requests:
+                break
+            method, path, body, auth = request
+            started = time.perf_counter()
+            try:
+                status, _ = client.request(method, path, body, auth)
+            except Exception:
+                status = None
+            local.append((name, time.perf_counter() - started, status))
+        with lock:
+            for name, elapsed, status in local:
+                if status is None or status >= 500:
+                    failures[name] += 1
+                if status is not None:
+                    samples[name].append(elapsed)
+                    statuses[name][str(status)] = statuses[name].get(str(status), 0) + 1
+
+    threads = [threading.Thread(target=worker, args=(client,)) for client in clients]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    routes = {}
+    for name in names:
+        latencies = sorted(samples[name])
+        routes[name] = {
+            'requests': len(latencies),
+            'failures': failures[name],
+            'throughput': len(latencies) / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'statuses': statuses[name],
+        }
+
+    everything = sorted(itertools.chain.from_iterable(samples.values()))
+    total = {
+        'requests': len(everything),
+        'failures': sum(failures.values()),
+        'throughput': len(everything) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(everything, 0.50) * 1000,
+        'p95_ms': percentile(everything, 0.95) * 1000,
+        'p99_ms': percentile(everything, 0.99) * 1000,
+    }
+    return {'elapsed_s': elapsed, 'routes': routes, 'total': total}
+
+def compare(result, baseline, max_regression):
+    """List regressions of p95 latency or throughput beyond the allowed fraction"""
+    problems = []
+    for name, current in result['routes'].items():
+        previous = baseline.get('routes', {}).get(name)
+        if not previous or not previous['requests'] or not current['requests']:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + max_regression):
+            problems.append(f"{name}: p95 {previous['p95_ms']:.2f}ms -> {current['p95_ms']:.2f}ms")
+        if current['throughput'] < previous['throughput'] * (1 - max_regression):
+            problems.append(f"{name}: throughput {previous['throughput']:.1f}/s -> {current['throughput']:.1f}/s")
+        if current['failures'] > previous['failures']:
+            problems.append(f"{name}: failures {previous['failures']} -> {current['failures']}")
+    return problems
+
+def print_report(result):
+    print(f"{'route':<22}{'reqs':>8}{'fail':>6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = list(result['routes'].items()) + [('TOTAL', result['total'])]
+    for name, stats in rows:
+        print(f"{name:<22}{stats['requests']:>8}{stats['failures']:>6}{stats['throughput']:>10.1f}"
+              f"{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run')
+    parser.add_argument('--requests', type=int, default=0, help='Stop after this many requests (0 = duration only)')
+    parser.add_argument('--users', type=int, default=200, help='Seeded accounts')
+    parser.add_argument('--mix', help="Weighted route mix, e.g. 'rewards=5,login=1' (default: all routes)")
+    parser.add_argument('--throttle', action='store_true',
+                        help='Keep per-IP/per-user rate limits (all clients share one IP)')
+    parser.add_argument('--seed', type=int, default=1234, help='Random seed')
+    parser.add_argument('--output', help='Write results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against a previous JSON result')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Allowed fractional p95/throughput regression vs. the baseline')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    mix = parse_mix(args.mix)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        seed_database(os.path.join(tmp, 'bench.db'), args.users)
+        server = start_server(args.throttle)
+        try:
+            result = run_load(server.server_port, mix, args.concurrency, args.duration,
+                              args.requests, args.users, args.seed)
+        finally:
+            server.shutdown()
+            db.ghost_mode_log.flush()
+            db.close_db()
+
+    result['config'] = {
+        'concurrency': args.concurrency,
+        'duration': args.duration,
+        'requests': args.requests,
+        'users': args.users,
+        'mix': mix,
+        'seed': args.seed,
+        'throttle': args.throttle,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    print_report(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        problems = compare(result, baseline, args.max_regression)
+        if problems:
+            print('Regressions against baseline:')
+            for problem in problems:
+                print(f'  {problem}')
+            sys.exit(1)
+        print('No regressions against baseline')
+
+if __name__ == '__main__':
+    main()
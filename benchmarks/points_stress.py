@@ -0,0 +1,118 @@
+"""Concurrency stress test for database.update_user_points.
+
+Hammers a handful of users from many threads and checks that every
+increment landed. Runs the previous read-modify-write implementation first
+as a baseline, then the current single-statement one, and reports
+throughput for both.
+
+    python benchmarks/points_stress.py --threads 16 --updates 500
+"""
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db
+
+def legacy_update_user_points(user_id, points_to_add):
+    """The old SELECT / compute / UPDATE / SELECT sequence, kept as a baseline"""
+    with db.get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
+        user = dict(cursor.fetchone())
+
+        new_points = user['points'] + points_to_add
+        new_streak = user['streak']
+        new_days_strong = user['days_strong']
+
+        current_date = datetime.datetime.now().strftime('%Y-%m-%d')
+        if points_to_add > 0 and user['last_active_date'] != current_date:
+            new_streak = max(1, new_streak)
+            new_days_strong = max(1, new_days_strong)
+            cursor.execute('UPDATE users SET last_active_date = ? WHERE id = ?', (current_date, user_id))
+
+        cursor.execute('''
+        UPDATE users SET points = ?, streak = ?, days_strong = ? WHERE id = ?
+        ''', (new_points, new_streak, new_days_strong, user_id))
+        cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
+        return dict(cursor.fetchone()), None
+
+def seed_users(count):
+    with db.get_db() as conn:
+        conn.execute('DELETE FROM users')
+        conn.executemany('''
+        INSERT INTO users (id, username, email, password, points, streak, days_strong)
+        VALUES (?, ?, ?, 'x', 0, 0, 0)
+        ''', [(i, f'user{i}', f'user{i}@example.com') for i in range(1, count + 1)])
+
+def run(update, threads, updates, users):
+    seed_users(users)
+    errors = []
+    barrier = threading.Barrier(threads)
+
+    def worker(index):
+        user_id = index % users + 1
+        barrier.wait()
+        for _ in range(updates):
+            try:
+                _, error = update(user_id, 1)
+                if error:
+                    errors.append(error)
+            except Exception as e:
+                errors.append(str(e))
+        db.close_db()
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with db.get_db() as conn:
+        total = conn.execute('SELECT SUM(points) FROM users').fetchone()[0]
+
+    expected = threads * updates
+    return {
+        'expected': expected,
+        'applied': total,
+        'lost': expected - total,
+        'errors': len(errors),
+        'seconds': elapsed,
+        'ops_per_sec': expected / elapsed if elapsed else 0.0,
+    }
+
+def report(name, result):
+    print(f"{name:<10} {result['ops_per_sec']:>10.0f} ops/s  "
+          f"applied {result['applied']}/{result['expected']}  "
+          f"lost {result['lost']}  errors {result['errors']}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--updates', type=int, default=500, help='Updates per thread')
+    parser.add_argument('--users', type=int, default=4, help='Distinct users being contended')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DATABASE_PATH = os.path.join(tmp, 'stress.db')
+        db.migrate()
+
+        baseline = run(legacy_update_user_points, args.threads, args.updates, args.users)
+        current = run(db.update_user_points, args.threads, args.updates, args.users)
+        db.close_db()
+
+    report('before', baseline)
+    report('after', current)
+    if current['lost'] or current['errors']:
+        print('FAIL: update_user_points lost or rejected increments')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
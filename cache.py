@@ -0,0 +1,226 @@
+import abc
+import copy
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import metrics
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Bound on a shared-tier round trip; a slow cache must not slow requests down
+SHARED_CACHE_TIMEOUT = 0.05
+
+class TTLCache:
+    """A thread-safe LRU cache whose entries also expire after a TTL.
+
+    Used for small per-worker caches (verified tokens, rank pages, ...).
+    Expired entries are dropped lazily on access and when the cache is full.
+    """
+    def __init__(self, maxsize=1024, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Get a live entry, refreshing its LRU position"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store an entry; ttl overrides the cache default for this entry"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+            'maxsize': self.maxsize
+        }
+
+class SharedCache(abc.ABC):
+    """A cache shared by every worker (Redis, memcached, ...).
+
+    Implementations store JSON-serializable values under string keys and
+    must treat failures as misses; the database stays the source of truth.
+    """
+    @abc.abstractmethod
+    def get(self, key):
+        """The value stored under key, or None"""
+
+    @abc.abstractmethod
+    def set(self, key, value, ttl):
+        """Store value under key for ttl seconds"""
+
+    @abc.abstractmethod
+    def delete(self, key):
+        """Drop key if present"""
+
+class LocalSharedCache(SharedCache):
+    """In-process stand-in for a SharedCache, for tests and single-worker setups.
+
+    Values round-trip through JSON like they would over the network, so
+    callers cannot come to rely on sharing mutable objects.
+    """
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            payload, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+        return json.loads(payload)
+
+    def set(self, key, value, ttl):
+        payload = json.dumps(value)
+        with self._lock:
+            self._data[key] = (payload, time.monotonic() + ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+class RedisSharedCache(SharedCache):
+    """SharedCache on a Redis server (needs the optional `redis` package)"""
+    def __init__(self, url, timeout=SHARED_CACHE_TIMEOUT):
+        if redis is None:
+            raise RuntimeError('A redis:// shared cache needs the redis package (pip install redis)')
+        # redis-py reopens its connections after a fork, so this may run before gunicorn forks
+        self.client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+
+    def get(self, key):
+        payload = self.client.get(key)
+        return None if payload is None else json.loads(payload)
+
+    def set(self, key, value, ttl):
+        self.client.set(key, json.dumps(value), ex=max(1, int(ttl)))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+def shared_cache_from_url(url):
+    """The SharedCache named by a CRUMBLE_SHARED_CACHE value: a redis:// URL,
+    'local' for the in-process stand-in, or empty for none"""
+    if not url:
+        return None
+    if url == 'local':
+        return LocalSharedCache()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisSharedCache(url)
+    raise ValueError(f'Unsupported shared cache: {url}')
+
+class TieredCache:
+    """A per-worker TTLCache in front of an optional SharedCache.
+
+    Reads try the local tier, then the shared tier (refilling the local one).
+    Writes and deletes go to both, so the writing worker is exact at once and
+    other workers converge within the local TTL. Values are copied on the way
+    in and out, so callers may mutate what they get back.
+    """
+    def __init__(self, name, local, shared=None, shared_ttl=300):
+        self.name = name
+        self.local = local
+        self.shared = shared
+        self.shared_ttl = shared_ttl
+        self.shared_hits = 0
+        self.shared_misses = 0
+
+    @staticmethod
+    def _key(key):
+        return ':'.join(str(part) for part in key)
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            metrics.observe_cache(self.name, 'local', True)
+            return copy.deepcopy(value)
+        metrics.observe_cache(self.name, 'local', False)
+
+        if self.shared is None:
+            return None
+        try:
+            value = self.shared.get(f'{self.name}:{self._key(key)}')
+        except Exception:
+            value = None
+        if value is None:
+            self.shared_misses += 1
+            metrics.observe_cache(self.name, 'shared', False)
+            return None
+        self.shared_hits += 1
+        metrics.observe_cache(self.name, 'shared', True)
+        self.local.set(key, value)
+        return copy.deepcopy(value)
+
+    def set(self, key, value):
+        value = copy.deepcopy(value)
+        self.local.set(key, value)
+        if self.shared is not None:
+            try:
+                self.shared.set(f'{self.name}:{self._key(key)}', value, self.shared_ttl)
+            except Exception:
+                # Whatever the shared tier still holds for this key is now suspect
+                self._shared_delete(key)
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.shared is not None:
+            self._shared_delete(key)
+
+    def _shared_delete(self, key):
+        try:
+            self.shared.delete(f'{self.name}:{self._key(key)}')
+        except Exception:
+            pass
+
+    def clear(self):
+        """Drop this worker's local tier (the shared tier expires on its own)"""
+        self.local.clear()
+
+    def stats(self):
+        """Hit/miss counters for both tiers"""
+        stats = {'local': self.local.stats()}
+        if self.shared is not None:
+            stats['shared'] = {'hits': self.shared_hits, 'misses': self.shared_misses}
+        return stats
@@ -0,0 +1,121 @@
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+
+# How often (seconds) a hit may stat the backing file to look for edits
+RELOAD_CHECK_INTERVAL = 2.0
+
+def parse_breakup_messages(file):
+    """Parse a breakup message CSV into [{'content', 'tone'}]"""
+    messages = []
+    for row in csv.DictReader(file):
+        # Handle both single-column and multi-column CSV files
+        content = row.get('content') or row.get('message') or list(row.values())[0]
+        tone = row.get('tone', 'classic')
+        messages.append({
+            'content': content,
+            'tone': tone
+        })
+    return messages
+
+def parse_magic_quiz(file):
+    """Parse the magic quiz CSV into [{'question', 'options'}]"""
+    questions = []
+    for row in csv.DictReader(file):
+        questions.append({
+            'question': row['Question'],
+            'options': [
+                row['Option1'],
+                row['Option2'],
+                row['Option3'],
+                row['Option4']
+            ]
+        })
+    return questions
+
+# Catalog name -> (CSV file name, parser)
+ASSET_SOURCES = {
+    'breakup_emoji': ('breakup_emoji.csv', parse_breakup_messages),
+    'breakup_call': ('breakup_call.csv', parse_breakup_messages),
+    'breakup_text': ('breakup_text.csv', parse_breakup_messages),
+    'magic_quiz': ('magic_quiz.csv', parse_magic_quiz),
+}
+
+class CatalogEntry:
+    """A parsed asset together with its pre-encoded JSON body and ETag"""
+    def __init__(self, data, mtime):
+        self.data = data
+        self.body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+        self.mtime = mtime
+        self.checked_at = time.monotonic()
+
+class AssetCatalog:
+    """Keeps every asset CSV parsed and serialized in memory.
+
+    Entries are loaded once up front. A hit stats the file at most once per
+    check_interval and re-parses it only when its mtime has changed.
+    """
+    def __init__(self, assets_dir=ASSETS_DIR, sources=None, check_interval=RELOAD_CHECK_INTERVAL):
+        self.assets_dir = assets_dir
+        self.sources = sources or ASSET_SOURCES
+        self.check_interval = check_interval
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _path(self, name):
+        return os.path.join(self.assets_dir, self.sources[name][0])
+
+    def _load(self, name):
+        path = self._path(name)
+        mtime = os.stat(path).st_mtime_ns
+        with open(path, 'r', encoding='utf-8') as file:
+            data = self.sources[name][1](file)
+        entry = CatalogEntry(data, mtime)
+        self._entries[name] = entry
+        return entry
+
+    def load_all(self):
+        """Load every known asset, skipping (and reporting) missing files"""
+        with self._lock:
+            for name in self.sources:
+                try:
+                    self._load(name)
+                except OSError as e:
+                    print(f"Asset catalog: could not load {name}: {e}")
+
+    def get(self, name):
+        """Get the current entry for an asset, reloading it if the file changed.
+
+        Raises KeyError for unknown names and FileNotFoundError if the file is missing.
+        """
+        if name not in self.sources:
+            raise KeyError(name)
+
+        entry = self._entries.get(name)
+        if entry is not None and time.monotonic() - entry.checked_at < self.check_interval:
+            return entry
+
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                return self._load(name)
+            if time.monotonic() - entry.checked_at < self.check_interval:
+                return entry
+
+            try:
+                mtime = os.stat(self._path(name)).st_mtime_ns
+            except FileNotFoundError:
+                # Keep serving the last good copy if the file is being replaced
+                entry.checked_at = time.monotonic()
+                return entry
+
+            if mtime != entry.mtime:
+                return self._load(name)
+            entry.checked_at = time.monotonic()
+            return entry
@@ -0,0 +1,137 @@
+"""gzip/brotli compression of API responses.
+
+Responses are compressed according to the client's Accept-Encoding. Bodies
+below MIN_SIZE are sent as they are. Streamed responses and large bodies are
+compressed chunk by chunk instead of in one piece. A response that carries an
+ETag and is marked public is the same for every user (the message catalogs,
+the quiz). Its compressed bytes are cached per (ETag, encoding), so it is
+compressed once per worker rather than on every hit.
+"""
+import os
+import zlib
+
+from cache import TTLCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_SIZE = int(os.environ.get('CRUMBLE_COMPRESS_MIN_SIZE', '1024'))
+# Buffered bodies at least this large are compressed and sent in chunks
+STREAM_SIZE = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# Per-request work favours speed; cached payloads are compressed once, so harder
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+CACHED_GZIP_LEVEL = 9
+CACHED_BROTLI_QUALITY = 11
+
+CACHE_SIZE = 128
+CACHE_TTL = 3600
+payload_cache = TTLCache(maxsize=CACHE_SIZE, ttl=CACHE_TTL)
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+
+def negotiate(accept_encodings):
+    """Pick the best supported encoding from a werkzeug Accept-Encoding header"""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+def _compressor(encoding, cached=False):
+    if encoding == 'br':
+        return brotli.Compressor(quality=CACHED_BROTLI_QUALITY if cached else BROTLI_QUALITY)
+    # wbits=31 writes a gzip header and trailer
+    return zlib.compressobj(CACHED_GZIP_LEVEL if cached else GZIP_LEVEL, zlib.DEFLATED, 31)
+
+def compress(data, encoding, cached=False):
+    """Compress a whole body in one go"""
+    compressor = _compressor(encoding, cached)
+    if encoding == 'br':
+        return compressor.process(data) + compressor.finish()
+    return compressor.compress(data) + compressor.flush()
+
+def compress_stream(chunks, encoding, flush=True):
+    """Compress an iterable of byte chunks, yielding compressed chunks.
+
+    With flush set, each input chunk is flushed through the compressor so the
+    client receives it at once (a streamed NDJSON line is not held back until
+    the compressor's buffer fills). A body that is only chunked to bound
+    memory passes flush=False and compresses better.
+    """
+    compressor = _compressor(encoding)
+    if encoding == 'br':
+        process, finish = compressor.process, compressor.finish
+        sync = compressor.flush
+    else:
+        process, finish = compressor.compress, compressor.flush
+        sync = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        data = process(chunk)
+        if flush and chunk:
+            data += sync()
+        if data:
+            yield data
+    yield finish()
+
+def _chunks(data):
+    for start in range(0, len(data), CHUNK_SIZE):
+        yield data[start:start + CHUNK_SIZE]
+
+def cached_compress(etag, data, encoding):
+    """Compressed bytes for a body shared by all users, computed once per ETag"""
+    key = (etag, encoding)
+    compressed = payload_cache.get(key)
+    if compressed is None:
+        compressed = compress(data, encoding, cached=True)
+        payload_cache.set(key, compressed)
+    return compressed
+
+def is_shared(cache_control, etag):
+    """Whether a response is identical for every client (safe to cache compressed)"""
+    return bool(etag) and 'public' in cache_control and 'private' not in cache_control
+
+def compress_response(request, response):
+    """after_request hook: compress a Flask response in place when worthwhile"""
+    if (response.status_code < 200 or response.status_code in (204, 206, 304)
+            or request.method == 'HEAD'
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or 'no-transform' in response.headers.get('Cache-Control', '')
+            or not response.mimetype.startswith(COMPRESSIBLE_TYPES)):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < MIN_SIZE:
+            return response
+        etag, _ = response.get_etag()
+        if is_shared(response.headers.get('Cache-Control', ''), etag):
+            response.set_data(cached_compress(etag, data, encoding))
+        elif len(data) >= STREAM_SIZE:
+            response.response = compress_stream(_chunks(data), encoding, flush=False)
+            response.headers.pop('Content-Length', None)
+        else:
+            response.set_data(compress(data, encoding))
+
+    response.content_encoding = encoding
+    # The encoded bytes differ from the identity ones, so the validator
+    # becomes weak; If-None-Match uses weak comparison, so 304s still work
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -1,113 +1,524 @@
 from werkzeug.security import generate_password_hash, check_password_hash
 import sqlite3
 import os
+import sys
+import re
 import json
+import base64
+import uuid
+import threading
+import time
+import atexit
+import datetime
+import itertools
+
+import achievements
+import importer
+import leaderboard
+import maintenance
+import passwords
+import templates
+from cache import TTLCache, TieredCache, shared_cache_from_url
+from metrics import metrics
 
 # Database setup
 DATABASE_PATH = 'crumble.db'
 
+# Connection tuning, applied once to every pooled connection
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KB = 16384
+MMAP_SIZE = 256 * 1024 * 1024
+STATEMENT_CACHE_SIZE = 256
+
+# One reusable connection per thread (gunicorn sync/gthread workers reuse their threads)
+_local = threading.local()
+
+def _caller_name(depth=2):
+    frame = sys._getframe(depth)
+    return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}"
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that counts and times every statement, labelled by the calling function"""
+    def _timed(self, method, caller, *args):
+        started = time.perf_counter()
+        failed = False
+        try:
+            return method(*args)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            metrics.observe_query(caller, time.perf_counter() - started, failed)
+    
+    def execute(self, sql, parameters=()):
+        return self._timed(super().execute, _caller_name(), sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self._timed(super().executemany, _caller_name(), sql, seq_of_parameters)
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors (including conn.execute shortcuts) are instrumented"""
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+    
+    def execute(self, sql, parameters=()):
+        cursor = self.cursor()
+        return cursor._timed(sqlite3.Cursor.execute, _caller_name(), cursor, sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        cursor = self.cursor()
+        return cursor._timed(sqlite3.Cursor.executemany, _caller_name(), cursor, sql, seq_of_parameters)
+
+def _open_connection():
+    """Open a new connection and apply the pragmas every helper relies on"""
+    conn = sqlite3.connect(
+        DATABASE_PATH,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        factory=InstrumentedConnection
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+def get_connection():
+    """Get this thread's pooled connection, opening it on first use"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid() and _local.path == DATABASE_PATH:
+        return conn
+    
+    # Connections must never cross a fork (gunicorn preload), so a child
+    # simply drops the inherited handle and opens its own
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+    
+    _local.conn = _open_connection()
+    _local.pid = os.getpid()
+    _local.path = DATABASE_PATH
+    _local.depth = 0
+    return _local.conn
+
+def close_db():
+    """Close this thread's pooled connection, if any"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+    _local.conn = None
+
 class DatabaseConnection:
+    """Borrow the thread's pooled connection for one unit of work.
+    
+    Blocks may nest (e.g. one helper calling another); only the outermost
+    block commits or rolls back, so nested helpers share a single transaction.
+    """
     def __init__(self):
         self.conn = None
     
     def __enter__(self):
-        self.conn = sqlite3.connect(DATABASE_PATH)
-        self.conn.row_factory = sqlite3.Row
+        self.conn = get_connection()
+        _local.depth += 1
         return self.conn
     
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if self.conn:
+        _local.depth -= 1
+        if self.conn and _local.depth == 0:
             if exc_type is None:
-                self.conn.commit()
+                try:
+                    self.conn.commit()
+                except sqlite3.Error:
+                    # Never hand the pooled connection on mid-transaction
+                    self.conn.rollback()
+                    raise
             else:
                 self.conn.rollback()
-            self.conn.close()
         return False
 
 def get_db():
     return DatabaseConnection()
 
-def init_db():
-    """Initialize the database with required tables"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
-    # Create users table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT NOT NULL,
-        email TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL,
-        points INTEGER DEFAULT 0,
-        streak INTEGER DEFAULT 0,
-        days_strong INTEGER DEFAULT 0,
-        last_active_date TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # Create rewards table to track claimed rewards
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS user_rewards (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        reward_id INTEGER,
-        claimed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (id)
-    )
-    ''')
-    
-    # Create ghost mode settings table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS ghost_mode_settings (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        block_messages BOOLEAN DEFAULT 0,
-        hide_status BOOLEAN DEFAULT 0,
-        mute_notifications BOOLEAN DEFAULT 0,
-        hide_activity BOOLEAN DEFAULT 0,
-        FOREIGN KEY (user_id) REFERENCES users (id)
-    )
-    ''')
-    
-    # Create social platforms table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS social_platforms (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        platform_name TEXT,
-        username TEXT,
-        connected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (id)
-    )
-    ''')
-    
-    # Create breakup messages table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS breakup_messages (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        type TEXT NOT NULL,  -- 'emoji', 'call', 'text'
-        title TEXT NOT NULL,
-        content TEXT NOT NULL,
-        tone TEXT  -- 'classic', 'gentle', 'blunt', 'humorous'
-    )
+def _backfill_achievements(conn):
+    """Award what users had already earned when awards moved to counter changes"""
+    columns = {'points': 'u.points', 'streak': 'u.streak', 'days_strong': 'u.days_strong',
+               'ghost_mode_days': 'gd.distinct_days'}
+    # Only users past some threshold can have anything to collect
+    candidates = ' OR '.join(f"{columns[metric]} >= {min(rule['threshold'] for rule in rules)}"
+                             for metric, rules in achievements.ACHIEVEMENTS_BY_METRIC.items() if metric in columns)
+    if not candidates:
+        return
+    cursor = conn.execute(f'''
+    SELECT u.id, u.points, u.streak, u.days_strong, gd.distinct_days AS ghost_mode_days
+    FROM users u
+    LEFT JOIN ghost_mode_days gd ON gd.user_id = u.id
+    WHERE {candidates}
     ''')
+    for row in cursor.fetchall():
+        achievements.evaluate(conn, row['id'], {metric: row[metric] for metric in row.keys() if metric != 'id'})
+
+# Schema migrations, applied in order exactly once and recorded in schema_version.
+# A step is an SQL statement or a function run with the migration's connection.
+# Released steps must never be edited; append a new step instead.
+MIGRATIONS = [
+    (1, 'Base tables', [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            points INTEGER DEFAULT 0,
+            streak INTEGER DEFAULT 0,
+            days_strong INTEGER DEFAULT 0,
+            last_active_date TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS user_rewards (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            reward_id INTEGER,
+            claimed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS ghost_mode_settings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            block_messages BOOLEAN DEFAULT 0,
+            hide_status BOOLEAN DEFAULT 0,
+            mute_notifications BOOLEAN DEFAULT 0,
+            hide_activity BOOLEAN DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS social_platforms (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            platform_name TEXT,
+            username TEXT,
+            connected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS breakup_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,  -- 'emoji', 'call', 'text'
+            title TEXT NOT NULL,
+            content TEXT NOT NULL,
+            tone TEXT  -- 'classic', 'gentle', 'blunt', 'humorous'
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS quiz_responses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            question_id INTEGER,
+            response TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+    ]),
+    (2, 'Achievements table', [
+        '''
+        CREATE TABLE IF NOT EXISTS user_achievements (
+            user_id INTEGER,
+            achievement_id INTEGER,
+            completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, achievement_id)
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_user_achievements_user_completed
+        ON user_achievements (user_id, completed_at)
+        ''',
+    ]),
+    (3, 'Per-user lookup indexes and uniqueness', [
+        # Drop duplicates left behind by the old check-then-insert helpers
+        '''
+        DELETE FROM user_rewards WHERE id NOT IN (
+            SELECT MIN(id) FROM user_rewards GROUP BY user_id, reward_id
+        )
+        ''',
+        '''
+        DELETE FROM social_platforms WHERE id NOT IN (
+            SELECT MIN(id) FROM social_platforms GROUP BY user_id, platform_name
+        )
+        ''',
+        '''
+        DELETE FROM ghost_mode_settings WHERE id NOT IN (
+            SELECT MIN(id) FROM ghost_mode_settings GROUP BY user_id
+        )
+        ''',
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_user_rewards_user_reward
+        ON user_rewards (user_id, reward_id)
+        ''',
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_social_platforms_user_platform
+        ON social_platforms (user_id, platform_name)
+        ''',
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_ghost_mode_settings_user
+        ON ghost_mode_settings (user_id)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_quiz_responses_user_question
+        ON quiz_responses (user_id, question_id)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_breakup_messages_type
+        ON breakup_messages (type)
+        ''',
+    ]),
+    (4, 'Ghost mode activity log and per-user day counters', [
+        '''
+        CREATE TABLE IF NOT EXISTS ghost_mode_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            action TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_ghost_mode_logs_user_timestamp
+        ON ghost_mode_logs (user_id, timestamp)
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS ghost_mode_days (
+            user_id INTEGER PRIMARY KEY,
+            distinct_days INTEGER NOT NULL DEFAULT 0,
+            last_day TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        # Seed the counters from any activity logged before they existed
+        '''
+        INSERT OR REPLACE INTO ghost_mode_days (user_id, distinct_days, last_day)
+        SELECT user_id, COUNT(DISTINCT date(timestamp)), MAX(date(timestamp))
+        FROM ghost_mode_logs
+        GROUP BY user_id
+        ''',
+    ]),
+    (5, 'Bulk import checkpoints', [
+        '''
+        CREATE TABLE IF NOT EXISTS import_checkpoints (
+            source TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            records INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (6, 'Reward catalog table with change tracking', [
+        '''
+        CREATE TABLE IF NOT EXISTS rewards (
+            id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL,
+            description TEXT NOT NULL DEFAULT '',
+            points INTEGER NOT NULL,
+            active INTEGER NOT NULL DEFAULT 1
+        )
+        ''',
+        '''
+        INSERT OR IGNORE INTO rewards (id, title, description, points) VALUES
+            (1, 'Digital Journal Theme', 'Unlock a premium journal theme', 100),
+            (2, 'Custom Affirmations', 'Create and save your own affirmations', 200),
+            (3, 'Advanced Analytics', 'Get detailed insights into your healing journey', 300),
+            (4, 'Meditation Collection', 'Access premium guided meditations', 500)
+        ''',
+        # Any write to a catalog table bumps its version so workers can reload cheaply
+        '''
+        CREATE TABLE IF NOT EXISTS catalog_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        "INSERT OR IGNORE INTO catalog_versions (name, version) VALUES ('rewards', 1)",
+        '''
+        CREATE TRIGGER IF NOT EXISTS rewards_version_insert AFTER INSERT ON rewards
+        BEGIN
+            UPDATE catalog_versions SET version = version + 1 WHERE name = 'rewards';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS rewards_version_update AFTER UPDATE ON rewards
+        BEGIN
+            UPDATE catalog_versions SET version = version + 1 WHERE name = 'rewards';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS rewards_version_delete AFTER DELETE ON rewards
+        BEGIN
+            UPDATE catalog_versions SET version = version + 1 WHERE name = 'rewards';
+        END
+        ''',
+    ]),
+    (7, 'Leaderboard index on points', [
+        '''
+        CREATE INDEX IF NOT EXISTS idx_users_points
+        ON users (points DESC, id)
+        ''',
+    ]),
+    (8, 'User-defined message templates', [
+        '''
+        CREATE TABLE IF NOT EXISTS message_templates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            content TEXT NOT NULL,
+            type TEXT NOT NULL DEFAULT 'text',
+            tone TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_message_templates_user
+        ON message_templates (user_id, id)
+        ''',
+    ]),
+    (9, 'Full-text search over breakup messages', [
+        # External-content index: the text lives only in breakup_messages
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS breakup_messages_fts USING fts5(
+            title, content,
+            content = 'breakup_messages', content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+        )
+        ''',
+        "INSERT INTO breakup_messages_fts (breakup_messages_fts) VALUES ('rebuild')",
+        '''
+        CREATE TRIGGER IF NOT EXISTS breakup_messages_fts_insert AFTER INSERT ON breakup_messages
+        BEGIN
+            INSERT INTO breakup_messages_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS breakup_messages_fts_delete AFTER DELETE ON breakup_messages
+        BEGIN
+            INSERT INTO breakup_messages_fts (breakup_messages_fts, rowid, title, content)
+            VALUES ('delete', old.id, old.title, old.content);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS breakup_messages_fts_update AFTER UPDATE OF title, content ON breakup_messages
+        BEGIN
+            INSERT INTO breakup_messages_fts (breakup_messages_fts, rowid, title, content)
+            VALUES ('delete', old.id, old.title, old.content);
+            INSERT INTO breakup_messages_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+        END
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_breakup_messages_tone
+        ON breakup_messages (tone)
+        ''',
+    ]),
+    (10, 'Keyset indexes for per-user lists', [
+        # Already covered: claimed rewards by (user_id, reward_id), and quiz
+        # responses by (user_id, question_id), which ends in the rowid (id)
+        '''
+        CREATE INDEX IF NOT EXISTS idx_social_platforms_user_connected
+        ON social_platforms (user_id, connected_at, platform_name)
+        ''',
+        'DROP INDEX IF EXISTS idx_user_achievements_user_completed',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_user_achievements_user_completed_id
+        ON user_achievements (user_id, completed_at, achievement_id)
+        ''',
+    ]),
+    (11, 'Group quiz responses by submission', [
+        'ALTER TABLE quiz_responses ADD COLUMN submission_id TEXT',
+        # One row per question and run (older rows are NULL, hence distinct)
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_quiz_responses_submission
+        ON quiz_responses (user_id, submission_id, question_id)
+        ''',
+    ]),
+    (12, 'Batch job checkpoints', [
+        '''
+        CREATE TABLE IF NOT EXISTS job_checkpoints (
+            job TEXT NOT NULL,
+            run_date TEXT NOT NULL,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            updated INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (job, run_date)
+        )
+        ''',
+    ]),
+    (13, 'List quiz responses in submission order', [
+        # Paging by id keeps each run's answers together; the question_id
+        # index only ordered by id within a single question
+        '''
+        CREATE INDEX IF NOT EXISTS idx_quiz_responses_user_id
+        ON quiz_responses (user_id, id)
+        ''',
+    ]),
+    (14, 'Award achievements earned before awards moved to counter changes', [
+        _backfill_achievements,
+    ]),
+]
+
+def get_schema_version():
+    """Get the highest applied migration version (0 for a fresh database)"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'
+        ''')
+        if cursor.fetchone() is None:
+            return 0
+        
+        cursor.execute('SELECT MAX(version) AS version FROM schema_version')
+        return cursor.fetchone()['version'] or 0
+
+def migrate():
+    """Apply pending schema migrations and return the resulting version"""
+    with get_db() as conn:
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
     
-    # Create quiz responses table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS quiz_responses (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        question_id INTEGER,
-        response TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (id)
-    )
-    ''')
+    for version, description, statements in MIGRATIONS:
+        with get_db() as conn:
+            # Take the write lock first so concurrent deploys apply each step once
+            conn.execute('BEGIN IMMEDIATE')
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1 FROM schema_version WHERE version = ?', (version,))
+            if cursor.fetchone() is not None:
+                continue
+            
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    cursor.execute(statement)
+            cursor.execute('''
+            INSERT INTO schema_version (version, description) VALUES (?, ?)
+            ''', (version, description))
+            print(f"Applied migration {version}: {description}")
     
-    conn.commit()
-    conn.close()
+    return get_schema_version()
+
+def init_db():
+    """Initialize the database: apply migrations, then seed default data"""
+    migrate()
     
     # Migrate existing users if any
     migrate_users_from_json()
@@ -115,88 +526,24 @@ def init_db():
     # Add default breakup messages
     add_default_breakup_messages()
 
-def migrate_users_from_json():
-    """Migrate existing users from JSON file to SQLite database"""
-    json_file = 'users.json'
-    
+def migrate_users_from_json(json_file='users.json'):
+    """Import users from the legacy JSON file (see importer.py)"""
     if not os.path.exists(json_file):
         return
-        
+    
     try:
-        with open(json_file, 'r') as f:
-            users = json.load(f)
-            
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        
-        for user in users:
-            # Check if user already exists
-            cursor.execute('SELECT id FROM users WHERE email = ?', (user['email'],))
-            if cursor.fetchone() is None:
-                cursor.execute('''
-                INSERT INTO users (id, username, email, password, points, streak, days_strong, last_active_date)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    user['id'],
-                    user['username'],
-                    user['email'],
-                    user['password'],
-                    user['points'],
-                    user['streak'],
-                    user['days_strong'],
-                    user.get('last_active_date')
-                ))
-                
-                # Migrate rewards if any
-                if 'rewards' in user and user['rewards']:
-                    for reward_id in user['rewards']:
-                        cursor.execute('''
-                        INSERT INTO user_rewards (user_id, reward_id)
-                        VALUES (?, ?)
-                        ''', (user['id'], reward_id))
-                
-                # Migrate ghost mode settings if any
-                if 'ghost_mode_settings' in user:
-                    settings = user['ghost_mode_settings']
-                    cursor.execute('''
-                    INSERT INTO ghost_mode_settings 
-                    (user_id, block_messages, hide_status, mute_notifications, hide_activity)
-                    VALUES (?, ?, ?, ?, ?)
-                    ''', (
-                        user['id'],
-                        settings.get('blockMessages', 0),
-                        settings.get('hideStatus', 0),
-                        settings.get('muteNotifications', 0),
-                        settings.get('hideActivity', 0)
-                    ))
-                
-                # Migrate connected platforms if any
-                if 'connected_platforms' in user:
-                    for platform in user['connected_platforms']:
-                        cursor.execute('''
-                        INSERT INTO social_platforms (user_id, platform_name, username)
-                        VALUES (?, ?, ?)
-                        ''', (
-                            user['id'],
-                            platform['name'],
-                            platform.get('username', '')
-                        ))
-        
-        conn.commit()
-        conn.close()
-    except Exception as e:
+        importer.import_users(json_file, get_db, verbose=False)
+    except (OSError, importer.ImportFormatError) as e:
         print(f"Error migrating users: {e}")
 
 def add_default_breakup_messages():
     """Add default breakup messages to the database"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
     # Check if messages already exist
-    cursor.execute('SELECT COUNT(*) FROM breakup_messages')
-    if cursor.fetchone()[0] > 0:
-        conn.close()
-        return
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM breakup_messages')
+        if cursor.fetchone()[0] > 0:
+            return
     
     # Emoji breakup messages
     emoji_messages = [
@@ -283,62 +630,128 @@ def add_default_breakup_messages():
     ]
     
     # Insert all messages
-    for message in emoji_messages + call_messages + text_messages:
-        cursor.execute('''
-        INSERT INTO breakup_messages (type, title, content, tone)
-        VALUES (?, ?, ?, ?)
-        ''', (
-            message['type'],
-            message['title'],
-            message['content'],
-            message['tone']
-        ))
-    
-    conn.commit()
-    conn.close()
+    with get_db() as conn:
+        cursor = conn.cursor()
+        for message in emoji_messages + call_messages + text_messages:
+            cursor.execute('''
+            INSERT INTO breakup_messages (type, title, content, tone)
+            VALUES (?, ?, ?, ?)
+            ''', (
+                message['type'],
+                message['title'],
+                message['content'],
+                message['tone']
+            ))
 
 # User management functions
+# Profile cache: users rows minus the password hash, plus email -> id, and
+# claimed rewards. The writing worker updates or drops its entries at once.
+# Writes also reach the shared tier (CRUMBLE_SHARED_CACHE, e.g. redis://host/0)
+# when one is set, but never other workers' local tiers, so those converge
+# within PROFILE_CACHE_TTL either way. The shared tier saves database reads
+# on local misses.
+PROFILE_CACHE_SIZE = 10000
+PROFILE_CACHE_TTL = 10
+PROFILE_COLUMNS = 'id, username, email, points, streak, days_strong, last_active_date, created_at'
+
+profile_cache = TieredCache('profile', TTLCache(maxsize=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL),
+                            shared_cache_from_url(os.environ.get('CRUMBLE_SHARED_CACHE')))
+
+def configure_shared_cache(shared, ttl=300):
+    """Back the profile cache with a cache.SharedCache (replaces CRUMBLE_SHARED_CACHE, e.g. in tests)"""
+    profile_cache.shared = shared
+    profile_cache.shared_ttl = ttl
+
+def cache_profile(row):
+    """Write a fresh users row (password hash dropped) through to the profile cache"""
+    profile = {key: row[key] for key in row.keys() if key != 'password'}
+    profile_cache.set(('user', profile['id']), profile)
+    profile_cache.set(('email', profile['email']), profile['id'])
+    return profile
+
+def invalidate_profile(user_id):
+    profile_cache.delete(('user', user_id))
+
 def get_user_by_email(email):
-    """Get a user by email"""
+    """Get a user's profile (no password hash) by email"""
+    user_id = profile_cache.get(('email', email))
+    if user_id is not None:
+        user = get_user_by_id(user_id)
+        if user:
+            return user
+    
     try:
         with get_db() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
+            cursor.execute(f'SELECT {PROFILE_COLUMNS} FROM users WHERE email = ?', (email,))
             user = cursor.fetchone()
             if user:
-                return dict(user)
+                return cache_profile(user)
             return None
     except sqlite3.Error as e:
         print(f"Database error: {str(e)}")
         return None
 
 def get_user_by_id(user_id):
-    """Get a user by ID"""
+    """Get a user's profile (no password hash) by ID"""
+    user = profile_cache.get(('user', user_id))
+    if user is not None:
+        return user
+    
     try:
         with get_db() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
+            cursor.execute(f'SELECT {PROFILE_COLUMNS} FROM users WHERE id = ?', (user_id,))
+            user = cursor.fetchone()
+            if user:
+                return cache_profile(user)
+            return None
+    except sqlite3.Error as e:
+        print(f"Database error: {str(e)}")
+        return None
+
+def get_user_credentials(email):
+    """Get the full users row, password hash included, for logging in.
+    
+    Always read from the database so a changed hash takes effect at once.
+    """
+    try:
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
             user = cursor.fetchone()
             if user:
+                cache_profile(user)
                 return dict(user)
             return None
     except sqlite3.Error as e:
         print(f"Database error: {str(e)}")
         return None
 
-def create_user(username, email, password):
-    """Create a new user"""
+def create_user(username, email, password, password_hash=None):
+    """Create a new user
+    
+    The password is hashed on the hashing pool outside any transaction;
+    passwords.PoolSaturated is left to propagate so the caller can shed load.
+    Callers that already hashed it (e.g. asynchronously) pass password_hash.
+    """
     try:
         with get_db() as conn:
             cursor = conn.cursor()
             
-            # Check if user already exists
+            # Check if user already exists (before paying for the hash)
             cursor.execute('SELECT id FROM users WHERE email = ?', (email,))
             if cursor.fetchone() is not None:
                 return None, "User already exists"
-            
-            # Hash password
-            hashed_password = generate_password_hash(password)
+    except sqlite3.Error as e:
+        return None, f"Database error: {str(e)}"
+    
+    # Hash password
+    hashed_password = password_hash or passwords.hash_password(password)
+    
+    try:
+        with get_db() as conn:
+            cursor = conn.cursor()
             
             # Insert new user
             cursor.execute('''
@@ -359,77 +772,78 @@ def create_user(username, email, password):
             user = cursor.fetchone()
             
             if user:
+                cache_profile(user)
                 return dict(user), None
             return None, "Failed to create user"
             
+    except sqlite3.IntegrityError:
+        # Lost a race with a concurrent registration for the same email
+        return None, "User already exists"
     except sqlite3.Error as e:
         return None, f"Database error: {str(e)}"
     except Exception as e:
         return None, f"Unexpected error: {str(e)}"
 
+def update_user_password(user_id, password_hash):
+    """Replace a user's stored password hash"""
+    try:
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('UPDATE users SET password = ? WHERE id = ?', (password_hash, user_id))
+            return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        print(f"Database error: {str(e)}")
+        return False
+
+# Single-statement points/streak transition. Every right-hand side sees the
+# pre-update row, so concurrent calls serialize on the write lock and never
+# lose an increment. Streaks only move when points are earned on a new day:
+# the next calendar day extends the streak, a longer gap resets it to 1.
+UPDATE_POINTS_SQL = '''
+UPDATE users SET
+    points = points + :points,
+    streak = CASE
+        WHEN :points <= 0 OR last_active_date IS :today THEN streak
+        WHEN julianday(:today) - julianday(last_active_date) = 1 THEN streak + 1
+        WHEN julianday(:today) - julianday(last_active_date) > 1 THEN 1
+        ELSE MAX(1, streak)
+    END,
+    days_strong = CASE
+        WHEN :points <= 0 OR last_active_date IS :today THEN days_strong
+        WHEN julianday(:today) - julianday(last_active_date) >= 1 THEN days_strong + 1
+        ELSE MAX(1, days_strong)
+    END,
+    last_active_date = CASE WHEN :points > 0 THEN :today ELSE last_active_date END
+WHERE id = :user_id
+RETURNING *
+'''
+
 def update_user_points(user_id, points_to_add):
     """Update user points and related stats"""
-    import datetime
-    
+    # The SQL compares :points numerically; a string or float would take the wrong branch
+    if not isinstance(points_to_add, int) or isinstance(points_to_add, bool):
+        return None, "Points must be an integer"
     try:
         with get_db() as conn:
             cursor = conn.cursor()
+            cursor.execute(UPDATE_POINTS_SQL, {
+                'points': points_to_add,
+                'today': datetime.datetime.now().strftime('%Y-%m-%d'),
+                'user_id': user_id
+            })
+            updated_user = cursor.fetchone()
             
-            # Get current user data
-            cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-            user = cursor.fetchone()
-            
-            if not user:
+            if not updated_user:
                 return None, "User not found"
             
-            user = dict(user)
-            
-            # Update points
-            new_points = user['points'] + points_to_add
-            
-            # Update streak and days_strong if points are being added
-            new_streak = user['streak']
-            new_days_strong = user['days_strong']
-            
-            if points_to_add > 0:
-                current_date = datetime.datetime.now().strftime('%Y-%m-%d')
-                last_active = user.get('last_active_date')
-                
-                if last_active != current_date:
-                    if last_active and (datetime.datetime.strptime(current_date, '%Y-%m-%d') - 
-                                       datetime.datetime.strptime(last_active, '%Y-%m-%d')).days == 1:
-                        # Consecutive day, increase streak
-                        new_streak += 1
-                        # Increase days_strong counter
-                        new_days_strong += 1
-                    elif last_active and (datetime.datetime.strptime(current_date, '%Y-%m-%d') - 
-                                         datetime.datetime.strptime(last_active, '%Y-%m-%d')).days > 1:
-                        # Streak broken, reset to 1
-                        new_streak = 1
-                        # Still increase days_strong
-                        new_days_strong += 1
-                    else:
-                        # First activity or same day
-                        new_streak = max(1, new_streak)
-                        new_days_strong = max(1, new_days_strong)
-                    
-                    # Update last active date
-                    cursor.execute('''
-                    UPDATE users SET last_active_date = ? WHERE id = ?
-                    ''', (current_date, user_id))
-            
-            # Update user
-            cursor.execute('''
-            UPDATE users SET points = ?, streak = ?, days_strong = ? WHERE id = ?
-            ''', (new_points, new_streak, new_days_strong, user_id))
-            
-            # Get updated user
-            cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-            updated_user = cursor.fetchone()
-            
-            if updated_user:
-                return dict(updated_user), None
-            return None, "Failed to update user"
+            # Award anything the new counters unlock, in this same transaction
+            updated_user = dict(updated_user)
+            _, points_added = achievements.evaluate(conn, user_id, updated_user)
+            updated_user['points'] += points_added
+        
+        cache_profile(updated_user)
+        record_points(user_id, updated_user['username'], updated_user['points'])
+        return updated_user, None
             
     except sqlite3.Error as e:
         return None, f"Database error: {str(e)}"
@@ -439,95 +853,405 @@ def update_user_points(user_id, points_to_add):
 # Breakup message functions
 def get_breakup_messages(message_type=None):
     """Get breakup messages, optionally filtered by type"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    with get_db() as conn:
+        cursor = conn.cursor()
+        
+        if message_type:
+            cursor.execute('SELECT * FROM breakup_messages WHERE type = ?', (message_type,))
+        else:
+            cursor.execute('SELECT * FROM breakup_messages')
+        
+        return [dict(row) for row in cursor.fetchall()]
+
+# Keyset pagination: a cursor is the sort key of the last row served,
+# opaque to clients, so a page costs the same no matter how deep it is
+def encode_cursor(*key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token, size):
+    """The sort key stored in a cursor, or None if it is not a cursor of that size"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(key, list) or len(key) != size:
+        return None
+    if not all(isinstance(part, (int, float, str)) and not isinstance(part, bool) for part in key):
+        return None
+    return key
+
+MESSAGE_SEARCH_MAX_LIMIT = 100
+MESSAGE_SEARCH_MAX_TERMS = 10
+# bm25 column weights: a hit in the title counts more than one in the body
+MESSAGE_SEARCH_WEIGHTS = (5.0, 1.0)
+
+def fts_query(text):
+    """Turn free text into an FTS5 query: every word must match, the last one as a prefix"""
+    terms = re.findall(r'\w+', text.lower())[:MESSAGE_SEARCH_MAX_TERMS]
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"' for term in terms) + '*'
+
+def search_breakup_messages(query=None, message_type=None, tone=None, limit=20, cursor=None):
+    """One page of breakup messages, returning ({'items', 'next_cursor'}, error).
+    
+    With a query, results are full-text matches on title and content, best
+    first; otherwise every message in id order. type and tone narrow either.
+    """
+    if not isinstance(limit, int) or not 1 <= limit <= MESSAGE_SEARCH_MAX_LIMIT:
+        return None, f"limit must be between 1 and {MESSAGE_SEARCH_MAX_LIMIT}"
+    match = fts_query(query) if query else None
+    if query and match is None:
+        return {'items': [], 'next_cursor': None}, None
+    after = None
+    if cursor:
+        after = decode_cursor(cursor, 2 if match else 1)
+        if after is None:
+            return None, "Invalid cursor"
     
+    filters, params = [], []
     if message_type:
-        cursor.execute('SELECT * FROM breakup_messages WHERE type = ?', (message_type,))
+        filters.append('m.type = ?')
+        params.append(message_type)
+    if tone:
+        filters.append('m.tone = ?')
+        params.append(tone)
+    
+    if match:
+        score = 'bm25(breakup_messages_fts, {}, {})'.format(*MESSAGE_SEARCH_WEIGHTS)
+        filters.insert(0, 'breakup_messages_fts MATCH ?')
+        params.insert(0, match)
+        if after:
+            filters.append(f'({score} > ? OR ({score} = ? AND m.id > ?))')
+            params.extend((after[0], after[0], after[1]))
+        sql = f'''
+        SELECT m.id, m.type, m.title, m.content, m.tone, {score} AS score
+        FROM breakup_messages_fts JOIN breakup_messages m ON m.id = breakup_messages_fts.rowid
+        WHERE {' AND '.join(filters)}
+        ORDER BY score, m.id
+        LIMIT ?
+        '''
     else:
-        cursor.execute('SELECT * FROM breakup_messages')
+        if after:
+            filters.append('m.id > ?')
+            params.append(after[0])
+        sql = f'''
+        SELECT m.id, m.type, m.title, m.content, m.tone
+        FROM breakup_messages m
+        {'WHERE ' + ' AND '.join(filters) if filters else ''}
+        ORDER BY m.id
+        LIMIT ?
+        '''
+    # One extra row tells whether another page exists
+    params.append(limit + 1)
     
-    messages = [dict(row) for row in cursor.fetchall()]
+    try:
+        with get_db() as conn:
+            rows = [dict(row) for row in conn.execute(sql, params)]
+    except sqlite3.Error as e:
+        return None, f"Database error: {str(e)}"
     
-    conn.close()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last['score'], last['id']) if match else encode_cursor(last['id'])
+    for row in rows:
+        row.pop('score', None)
+    return {'items': rows, 'next_cursor': next_cursor}, None
+
+# Message template functions
+MAX_TEMPLATES_PER_USER = 50
+MAX_TEMPLATE_TITLE_LENGTH = 100
+
+def _template_payload(row, source):
+    template = templates.compile_template(row['content'])
+    payload = dict(row)
+    payload['source'] = source
+    payload['variables'] = list(template.variables)
+    return payload
+
+def get_message_templates(user_id):
+    """The built-in breakup messages and a user's own templates, with their variables"""
+    with get_db() as conn:
+        builtin = conn.execute('''
+        SELECT id, type, title, content, tone FROM breakup_messages ORDER BY id
+        ''').fetchall()
+        custom = conn.execute('''
+        SELECT id, type, title, content, tone, created_at FROM message_templates
+        WHERE user_id = ?
+        ORDER BY id
+        ''', (user_id,)).fetchall()
+    return ([_template_payload(row, 'builtin') for row in builtin]
+            + [_template_payload(row, 'custom') for row in custom])
+
+def create_message_template(user_id, title, content, message_type='text', tone=None):
+    """Save a user-defined template, returning (template, error)"""
+    if not isinstance(title, str) or not title.strip():
+        return None, "Title is required"
+    if len(title) > MAX_TEMPLATE_TITLE_LENGTH:
+        return None, f"Titles are limited to {MAX_TEMPLATE_TITLE_LENGTH} characters"
+    if message_type not in ('emoji', 'call', 'text'):
+        return None, "Invalid message type"
+    try:
+        templates.compile_template(content)
+    except templates.TemplateError as e:
+        return None, str(e)
+    
+    try:
+        with get_db() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            count = conn.execute('SELECT COUNT(*) FROM message_templates WHERE user_id = ?',
+                                 (user_id,)).fetchone()[0]
+            if count >= MAX_TEMPLATES_PER_USER:
+                return None, f"You can save at most {MAX_TEMPLATES_PER_USER} templates"
+            row = conn.execute('''
+            INSERT INTO message_templates (user_id, title, content, type, tone)
+            VALUES (?, ?, ?, ?, ?)
+            RETURNING id, type, title, content, tone, created_at
+            ''', (user_id, title.strip(), content, message_type, tone)).fetchone()
+            return _template_payload(row, 'custom'), None
+    except sqlite3.Error as e:
+        return None, f"Database error: {str(e)}"
+
+def delete_message_template(user_id, template_id):
+    """Delete one of a user's templates; False if there was no such template"""
+    with get_db() as conn:
+        cursor = conn.execute('DELETE FROM message_templates WHERE id = ? AND user_id = ?',
+                              (template_id, user_id))
+        return cursor.rowcount > 0
+
+def get_compiled_template(user_id, message_id=None, template_id=None):
+    """Compile a built-in message (message_id) or one of the user's templates (template_id).
+    
+    Returns (CompiledTemplate, error); error is None when the template was found.
+    """
+    with get_db() as conn:
+        if message_id is not None:
+            row = conn.execute('SELECT content FROM breakup_messages WHERE id = ?',
+                               (message_id,)).fetchone()
+        else:
+            row = conn.execute('SELECT content FROM message_templates WHERE id = ? AND user_id = ?',
+                               (template_id, user_id)).fetchone()
+    if row is None:
+        return None, "Template not found"
+    return templates.compile_template(row['content']), None
+
+# Per-user lists, read a keyset page at a time: (columns, table, sort key,
+# newest first). Each sort key is unique per user and is the tail of an index
+# on (user_id, *key), so a page is one index range scan however long the list.
+USER_LISTS = {
+    'social_platforms': ('platform_name, username, connected_at', 'social_platforms',
+                         ('connected_at', 'platform_name'), True),
+    'achievements': ('achievement_id, completed_at', 'user_achievements',
+                     ('completed_at', 'achievement_id'), True),
+    'quiz_responses': ('id, submission_id, question_id, response, created_at', 'quiz_responses',
+                       ('id',), False),
+    'claimed_rewards': ('reward_id', 'user_rewards', ('reward_id',), False),
+}
+USER_LIST_DEFAULT_LIMIT = 50
+USER_LIST_MAX_LIMIT = 100
+
+def _user_list(conn, name, user_id, limit=None, after=None):
+    columns, table, key, descending = USER_LISTS[name]
+    direction = 'DESC' if descending else 'ASC'
+    sql = f'SELECT {columns} FROM {table} WHERE user_id = ?'
+    params = [user_id]
+    if after is not None:
+        sql += f" AND ({', '.join(key)}) {'<' if descending else '>'} ({', '.join('?' * len(key))})"
+        params.extend(after)
+    sql += ' ORDER BY ' + ', '.join(f'{column} {direction}' for column in key)
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    return [dict(row) for row in conn.execute(sql, params)]
+
+def get_user_list_page(name, user_id, limit=USER_LIST_DEFAULT_LIMIT, cursor=None):
+    """One page of a USER_LISTS list, returning ({'items', 'next_cursor'}, error)"""
+    if not isinstance(limit, int) or not 1 <= limit <= USER_LIST_MAX_LIMIT:
+        return None, f"limit must be between 1 and {USER_LIST_MAX_LIMIT}"
+    key = USER_LISTS[name][2]
+    after = None
+    if cursor:
+        after = decode_cursor(cursor, len(key))
+        if after is None:
+            return None, "Invalid cursor"
+    
+    try:
+        with get_db() as conn:
+            # One extra row tells whether another page exists
+            rows = _user_list(conn, name, user_id, limit + 1, after)
+    except sqlite3.Error as e:
+        return None, f"Database error: {str(e)}"
     
-    return messages
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(*(rows[-1][column] for column in key))
+    return {'items': rows, 'next_cursor': next_cursor}, None
 
 # Quiz and recommendation functions
 def save_quiz_response(user_id, question_id, response):
     """Save a user's quiz response"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-    INSERT INTO quiz_responses (user_id, question_id, response)
-    VALUES (?, ?, ?)
-    ''', (user_id, question_id, response))
-    
-    conn.commit()
-    conn.close()
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        INSERT INTO quiz_responses (user_id, question_id, response)
+        VALUES (?, ?, ?)
+        ''', (user_id, question_id, response))
     
     return True
 
-def get_user_quiz_responses(user_id):
-    """Get a user's quiz responses"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-    SELECT * FROM quiz_responses WHERE user_id = ?
-    ORDER BY question_id
-    ''', (user_id,))
-    
-    responses = [dict(row) for row in cursor.fetchall()]
+SUBMISSION_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+def save_quiz_submission(user_id, responses, submission_id=None):
+    """Save a whole quiz run in one transaction, returning (submission, error).
     
-    conn.close()
+    responses are (question_id, response) pairs. submission is
+    {'submission_id', 'responses', 'replayed'}; a resubmitted submission_id
+    with the same answers is a replay of the stored run (replayed is True),
+    with different answers it is the error "Submission already exists".
+    """
+    if submission_id is None:
+        submission_id = uuid.uuid4().hex
+    elif not isinstance(submission_id, str) or not SUBMISSION_ID_PATTERN.fullmatch(submission_id):
+        return None, "Invalid submission_id"
+    responses = sorted(responses)
     
-    return responses
+    try:
+        with get_db() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            stored = [(row['question_id'], row['response']) for row in conn.execute('''
+            SELECT question_id, response FROM quiz_responses
+            WHERE user_id = ? AND submission_id = ?
+            ORDER BY question_id
+            ''', (user_id, submission_id))]
+            if stored:
+                if stored != responses:
+                    return None, "Submission already exists"
+                return {'submission_id': submission_id, 'responses': stored, 'replayed': True}, None
+            
+            conn.executemany('''
+            INSERT INTO quiz_responses (user_id, submission_id, question_id, response)
+            VALUES (?, ?, ?, ?)
+            ''', [(user_id, submission_id, question_id, response) for question_id, response in responses])
+        return {'submission_id': submission_id, 'responses': responses, 'replayed': False}, None
+    except sqlite3.Error as e:
+        return None, f"Database error: {str(e)}"
+
+def get_user_quiz_responses(user_id):
+    """Get all of a user's quiz responses (see get_user_list_page for pages)"""
+    with get_db() as conn:
+        return _user_list(conn, 'quiz_responses', user_id)
 
 # Reward functions
 def get_user_rewards(user_id):
     """Get a user's claimed rewards"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT reward_id FROM user_rewards WHERE user_id = ?
+        ''', (user_id,))
+        
+        return [row['reward_id'] for row in cursor.fetchall()]
+
+# How often (seconds) a catalog read may check catalog_versions for edits
+REWARD_CATALOG_CHECK_INTERVAL = 2.0
+
+class RewardCatalog:
+    """In-memory copy of the active rows of the rewards table.
+    
+    A read checks the catalog's version at most once per check_interval and
+    reloads the rows only when a trigger has bumped it.
+    """
+    def __init__(self, check_interval=REWARD_CATALOG_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._rewards = []
+        self._by_id = {}
+        self._version = None
+        self._path = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
     
-    cursor.execute('''
-    SELECT reward_id FROM user_rewards WHERE user_id = ?
-    ''', (user_id,))
+    def _is_fresh(self):
+        return self._path == DATABASE_PATH and time.monotonic() - self._checked_at < self.check_interval
     
-    rewards = [row['reward_id'] for row in cursor.fetchall()]
+    def _refresh(self):
+        if self._is_fresh():
+            return
+        with self._lock:
+            if self._is_fresh():
+                return
+            with get_db() as conn:
+                row = conn.execute("SELECT version FROM catalog_versions WHERE name = 'rewards'").fetchone()
+                version = row['version'] if row else None
+                if version != self._version or self._path != DATABASE_PATH:
+                    rewards = [dict(row) for row in conn.execute('''
+                    SELECT id, title, description, points FROM rewards
+                    WHERE active = 1
+                    ORDER BY points, id
+                    ''')]
+                    self._rewards = rewards
+                    self._by_id = {reward['id']: reward for reward in rewards}
+                    self._version = version
+                    self._path = DATABASE_PATH
+            self._checked_at = time.monotonic()
     
-    conn.close()
+    def all(self):
+        """Every active reward, cheapest first"""
+        self._refresh()
+        return self._rewards
     
-    return rewards
+    def get(self, reward_id):
+        """One active reward by id, or None"""
+        self._refresh()
+        return self._by_id.get(reward_id)
+
+reward_catalog = RewardCatalog()
+
+def get_reward_catalog():
+    """The active rewards, served from memory"""
+    return reward_catalog.all()
+
+# Unlocking, the points check and the duplicate check in one statement; the
+# unique (user_id, reward_id) index makes concurrent double-submits harmless
+CLAIM_REWARD_SQL = '''
+INSERT INTO user_rewards (user_id, reward_id)
+SELECT users.id, rewards.id
+FROM users JOIN rewards ON rewards.id = :reward_id AND rewards.active = 1
+WHERE users.id = :user_id AND users.points >= rewards.points
+ON CONFLICT (user_id, reward_id) DO NOTHING
+RETURNING reward_id
+'''
 
 def claim_reward(user_id, reward_id):
-    """Claim a reward for a user"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
-    # Check if already claimed
-    cursor.execute('''
-    SELECT id FROM user_rewards WHERE user_id = ? AND reward_id = ?
-    ''', (user_id, reward_id))
-    
-    if cursor.fetchone() is not None:
-        conn.close()
-        return False, "Reward already claimed"
-    
-    # Add reward
-    cursor.execute('''
-    INSERT INTO user_rewards (user_id, reward_id)
-    VALUES (?, ?)
-    ''', (user_id, reward_id))
-    
-    conn.commit()
-    conn.close()
+    """Claim a reward for a user, returning (claimed reward ids, error)"""
+    if reward_catalog.get(reward_id) is None:
+        return None, "Invalid reward ID"
     
-    return True, None
+    try:
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute(CLAIM_REWARD_SQL, {'user_id': user_id, 'reward_id': reward_id})
+            inserted = cursor.fetchone() is not None
+            
+            cursor.execute('''
+            SELECT reward_id FROM user_rewards WHERE user_id = ?
+            ''', (user_id,))
+            claimed = [row['reward_id'] for row in cursor.fetchall()]
+            if inserted:
+                profile_cache.set(('rewards', user_id), claimed)
+                return claimed, None
+            
+            # Nothing inserted: work out why (only on the failure path)
+            if reward_id in claimed:
+                return None, "Reward already claimed"
+            cursor.execute('SELECT id FROM users WHERE id = ?', (user_id,))
+            if cursor.fetchone() is None:
+                return None, "User not found"
+            return None, "Not enough points to claim this reward"
+    except sqlite3.Error as e:
+        return None, f"Database error: {str(e)}"
 
 # Ghost mode functions
 def get_ghost_mode_settings(user_id):
@@ -594,20 +1318,11 @@ def update_ghost_mode_settings(user_id, settings):
         return False
 
 # Social platform functions
-def get_user_social_platforms(user_id):
-    """Get all social platforms connected to a user"""
+def get_user_social_platforms(user_id, limit=None):
+    """Get the social platforms connected to a user, newest first"""
     try:
         with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-            SELECT platform_name, username, connected_at
-            FROM social_platforms
-            WHERE user_id = ?
-            ORDER BY connected_at DESC
-            ''', (user_id,))
-            
-            platforms = [dict(row) for row in cursor.fetchall()]
-            return platforms
+            return _user_list(conn, 'social_platforms', user_id, limit)
     except sqlite3.Error as e:
         print(f"Database error: {str(e)}")
         return None
@@ -653,50 +1368,176 @@ def remove_social_platform(user_id, platform_name):
         print(f"Database error: {str(e)}")
         return False
 
+# Ghost mode activity log
+GHOST_LOG_FLUSH_SIZE = 100
+GHOST_LOG_FLUSH_INTERVAL = 5.0
+# Events kept for retry while the database refuses writes; beyond this the oldest go
+GHOST_LOG_MAX_PENDING = 10000
+
+class GhostModeActivityLog:
+    """Buffers ghost mode activity and appends it to ghost_mode_logs in batches.
+    
+    Each flush runs in one transaction: (user, day) pairs not yet in the log
+    bump that user's ghost_mode_days counter (and may unlock achievements),
+    then the whole batch is inserted with one executemany. Because the
+    "already logged today?" probe runs under the write lock, counters stay
+    exact across workers and out-of-order flushes.
+    
+    Only a full batch (on the recording thread) and a daemon thread that
+    runs every flush_interval ever flush, so reads never write; they add the
+    user's buffered days to the stored counter instead (pending_days). A
+    batch that fails to write is queued again.
+    """
+    def __init__(self, flush_size=GHOST_LOG_FLUSH_SIZE, flush_interval=GHOST_LOG_FLUSH_INTERVAL,
+                 max_pending=GHOST_LOG_MAX_PENDING):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = []
+        # Batches being written, still visible to pending_days until they commit
+        self._flushing = []
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._flusher_pid = None
+    
+    def _ensure_flusher(self):
+        # Started lazily and per process: threads do not survive a fork
+        if self._flusher_pid == os.getpid() and self._flusher.is_alive():
+            return
+        self._flusher_pid = os.getpid()
+        self._flusher = threading.Thread(target=self._run_flusher, name='crumble-ghost-log', daemon=True)
+        self._flusher.start()
+    
+    def _run_flusher(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if self.has_pending():
+                self.flush()
+    
+    def record(self, user_id, action):
+        """Queue one activity event, flushing if the batch is full"""
+        timestamp = datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            self._ensure_flusher()
+            self._pending.append((user_id, action, timestamp))
+            due = len(self._pending) >= self.flush_size
+        if due:
+            self.flush()
+    
+    def has_pending(self):
+        with self._lock:
+            return bool(self._pending)
+    
+    def pending_days(self, user_id):
+        """The days ('YYYY-MM-DD') of a user's events that are not written yet"""
+        with self._lock:
+            events = itertools.chain(self._pending, *self._flushing)
+            return {timestamp[:10] for uid, _, timestamp in events if uid == user_id}
+    
+    def _requeue(self, batch):
+        with self._lock:
+            pending = batch + self._pending
+            if len(pending) > self.max_pending:
+                print(f"Ghost mode log: dropping {len(pending) - self.max_pending} unwritten events")
+                pending = pending[-self.max_pending:]
+            self._pending = pending
+    
+    def flush(self):
+        """Write every queued event; returns the number written"""
+        with self._lock:
+            batch, self._pending = self._pending, []
+            self._flushing.append(batch)
+        if not batch:
+            return 0
+        try:
+            return self._write(batch)
+        finally:
+            with self._lock:
+                self._flushing = [other for other in self._flushing if other is not batch]
+    
+    def _write(self, batch):
+        new_days = sorted({(user_id, timestamp[:10]) for user_id, _, timestamp in batch},
+                          key=lambda pair: pair[1])
+        credited = set()
+        try:
+            with get_db() as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                cursor = conn.cursor()
+                for user_id, day in new_days:
+                    cursor.execute('''
+                    INSERT INTO ghost_mode_days (user_id, distinct_days, last_day)
+                    SELECT :user_id, 1, :day
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM ghost_mode_logs
+                        WHERE user_id = :user_id
+                          AND timestamp >= :day AND timestamp < date(:day, '+1 day')
+                    )
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        distinct_days = distinct_days + 1,
+                        last_day = MAX(COALESCE(last_day, ''), excluded.last_day)
+                    RETURNING distinct_days
+                    ''', {'user_id': user_id, 'day': day})
+                    counter = cursor.fetchone()
+                    if counter:
+                        _, points_added = achievements.evaluate(conn, user_id, {'ghost_mode_days': counter['distinct_days']})
+                        if points_added:
+                            credited.add(user_id)
+                
+                cursor.executemany('''
+                INSERT INTO ghost_mode_logs (user_id, action, timestamp)
+                VALUES (?, ?, ?)
+                ''', batch)
+            
+            # Achievement bonuses moved points
+            for user_id in credited:
+                invalidate_profile(user_id)
+            if credited:
+                top_users.invalidate()
+            return len(batch)
+        except sqlite3.Error as e:
+            # Nothing was committed; keep the events for the next flush
+            print(f"Database error: {str(e)}")
+            self._requeue(batch)
+            return 0
+
+ghost_mode_log = GhostModeActivityLog()
+atexit.register(ghost_mode_log.flush)
+
+def log_ghost_mode_activity(user_id, action):
+    """Record that a user used ghost mode (written in batches)"""
+    ghost_mode_log.record(user_id, action)
+
+def _ghost_mode_days(user_id, distinct_days, last_day):
+    """The stored day counter plus the days still buffered in this worker"""
+    # Days are logged in order, so a buffered day after last_day is a new one
+    new_days = [day for day in ghost_mode_log.pending_days(user_id) if day > (last_day or '')]
+    return (distinct_days or 0) + len(new_days)
+
 def get_ghost_mode_days(user_id):
     """Get the number of days a user has used ghost mode"""
     try:
         with get_db() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT COUNT(DISTINCT date(timestamp)) as days
-                FROM ghost_mode_logs
-                WHERE user_id = ?
+                SELECT distinct_days, last_day FROM ghost_mode_days WHERE user_id = ?
             ''', (user_id,))
             result = cursor.fetchone()
-            return result['days'] if result else 0
     except sqlite3.Error:
         return 0
+    return _ghost_mode_days(user_id, *(result or (0, None)))
 
 def get_user_achievements(user_id):
-    """Get user's achievements with completion dates"""
+    """Get user's achievements with completion dates, most recent first"""
     try:
         with get_db() as conn:
-            cursor = conn.cursor()
-            # Create achievements table if it doesn't exist
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_achievements (
-                    user_id INTEGER,
-                    achievement_id INTEGER,
-                    completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    PRIMARY KEY (user_id, achievement_id)
-                )
-            ''')
-            
-            # Get completed achievements
-            cursor.execute('''
-                SELECT achievement_id, completed_at
-                FROM user_achievements
-                WHERE user_id = ?
-                ORDER BY completed_at DESC
-            ''', (user_id,))
-            return [dict(row) for row in cursor.fetchall()]
+            # At most one row per catalog entry, so reading them all is bounded
+            return _user_list(conn, 'achievements', user_id)
     except sqlite3.Error as e:
         print(f"Database error: {str(e)}")
         return []
 
 def save_achievement(user_id, achievement_id):
-    """Save a completed achievement"""
+    """Save a completed achievement and credit its points in one transaction"""
     try:
         with get_db() as conn:
             cursor = conn.cursor()
@@ -704,23 +1545,35 @@ def save_achievement(user_id, achievement_id):
                 INSERT OR IGNORE INTO user_achievements (user_id, achievement_id)
                 VALUES (?, ?)
             ''', (user_id, achievement_id))
-            return True
+            
+            achievement = achievements.ACHIEVEMENTS_BY_ID.get(achievement_id)
+            updated_user = None
+            if cursor.rowcount == 1 and achievement:
+                cursor.execute('''
+                    UPDATE users SET points = points + ? WHERE id = ? RETURNING username, points
+                ''', (achievement['points'], user_id))
+                updated_user = cursor.fetchone()
+        
+        if updated_user:
+            invalidate_profile(user_id)
+            record_points(user_id, updated_user['username'], updated_user['points'])
+        return True
     except sqlite3.Error as e:
         print(f"Database error: {str(e)}")
         return False
 
 def get_user_claimed_rewards(user_id):
     """Get all rewards claimed by a user"""
+    claimed = profile_cache.get(('rewards', user_id))
+    if claimed is not None:
+        return claimed
+    
     try:
         with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-            SELECT reward_id
-            FROM user_rewards
-            WHERE user_id = ?
-            ''', (user_id,))
-            
-            return [row['reward_id'] for row in cursor.fetchall()]
+            # At most one row per catalog entry, so reading them all is bounded
+            claimed = [row['reward_id'] for row in _user_list(conn, 'claimed_rewards', user_id)]
+        profile_cache.set(('rewards', user_id), claimed)
+        return claimed
     except sqlite3.Error as e:
         print(f"Database error: {str(e)}")
         return []
@@ -792,4 +1645,271 @@ def disconnect_social_platform(user_id, platform_name):
     except sqlite3.Error as e:
         return False
     except Exception as e:
-        return False
\ No newline at end of file
+        return False
+
+# Leaderboard: ranked by points, ties going to the older account (lower id)
+LEADERBOARD_MAX_LIMIT = 100
+LEADERBOARD_MAX_WINDOW = 10
+# Users outside the top K are ranked by counting everyone ahead of them on
+# idx_users_points. The count stops here so a lookup stays bounded; anyone
+# further down gets rank None.
+LEADERBOARD_MAX_RANK = 100000
+RANK_CACHE_SIZE = 10000
+RANK_CACHE_TTL = 5
+
+top_users = leaderboard.TopK()
+rank_cache = TTLCache(maxsize=RANK_CACHE_SIZE, ttl=RANK_CACHE_TTL)
+
+def record_points(user_id, username, points):
+    """Reflect a user's new points total in this worker's leaderboard state"""
+    top_users.update(user_id, username, points)
+    rank_cache.delete(('around', user_id))
+
+def _leaderboard_entry(rank, user_id, username, points):
+    return {'rank': rank, 'user_id': user_id, 'username': username, 'points': points}
+
+def _load_top_users():
+    if not top_users.is_stale(DATABASE_PATH):
+        return
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT id, username, points FROM users
+        ORDER BY points DESC, id
+        LIMIT ?
+        ''', (top_users.size,))
+        top_users.load([tuple(row) for row in cursor.fetchall()], DATABASE_PATH)
+
+def get_leaderboard(limit=10, cursor=None):
+    """One page of the global leaderboard, best first, returning ({'items', 'next_cursor'}, error).
+    
+    The cursor carries (rank, points, id) of the last entry served. Pages
+    past the in-memory top K seek on idx_users_points from that key, so a
+    deep page costs the same as the first; their ranks count on from the
+    cursor's.
+    """
+    if not isinstance(limit, int) or not 1 <= limit <= LEADERBOARD_MAX_LIMIT:
+        return None, f"limit must be between 1 and {LEADERBOARD_MAX_LIMIT}"
+    after = None
+    if cursor:
+        after = decode_cursor(cursor, 3)
+        if after is None or not all(isinstance(part, int) for part in after):
+            return None, "Invalid cursor"
+    
+    try:
+        _load_top_users()
+        # One extra entry tells whether another page exists
+        entries = top_users.page(after and after[1:], limit + 1)
+        if entries is None:
+            entries = _leaderboard_after(after or (0, None, None), limit + 1)
+    except sqlite3.Error as e:
+        return None, f"Database error: {str(e)}"
+    
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        rank, user_id, _, points = entries[-1]
+        next_cursor = encode_cursor(rank, points, user_id)
+    return {'items': [_leaderboard_entry(*entry) for entry in entries], 'next_cursor': next_cursor}, None
+
+def _leaderboard_after(after, limit):
+    """[(rank, user_id, username, points)] following the (rank, points, id) key, cached briefly"""
+    rank, points, user_id = after
+    key = ('page', points, user_id, limit)
+    rows = rank_cache.get(key)
+    if rows is None:
+        with get_db() as conn:
+            cursor = conn.cursor()
+            params = {'points': points, 'id': user_id, 'n': limit}
+            if points is None:
+                cursor.execute('''
+                SELECT id, username, points FROM users
+                ORDER BY points DESC, id LIMIT :n
+                ''', params)
+                rows = cursor.fetchall()
+            else:
+                # Range scans of idx_users_points: the rest of this points value, then lower ones
+                cursor.execute('''
+                SELECT id, username, points FROM users WHERE points = :points AND id > :id
+                ORDER BY id LIMIT :n
+                ''', params)
+                rows = cursor.fetchall()
+                if len(rows) < limit:
+                    cursor.execute('''
+                    SELECT id, username, points FROM users WHERE points < :points
+                    ORDER BY points DESC, id LIMIT :n
+                    ''', params)
+                    rows += cursor.fetchall()
+            rows = [tuple(row) for row in rows[:limit]]
+        rank_cache.set(key, rows)
+    return [(rank + i + 1, *row) for i, row in enumerate(rows)]
+
+def get_user_rank(user_id, window=5):
+    """A user's rank plus up to `window` neighbours on each side, or None if unknown.
+    
+    Ranks past LEADERBOARD_MAX_RANK are not counted and come back as None.
+    """
+    window = min(window, LEADERBOARD_MAX_WINDOW)
+    key = ('around', user_id)
+    result = rank_cache.get(key)
+    if result is None:
+        try:
+            result = _load_user_rank(user_id)
+        except sqlite3.Error as e:
+            print(f"Database error: {str(e)}")
+            return None
+        if result is None:
+            return None
+        rank_cache.set(key, result)
+    
+    return {
+        **result,
+        'above': result['above'][len(result['above']) - window:] if window else [],
+        'below': result['below'][:window]
+    }
+
+def _load_user_rank(user_id):
+    # Every query here is a range scan of idx_users_points
+    _load_top_users()
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, username, points FROM users WHERE id = ?', (user_id,))
+        user = cursor.fetchone()
+        if user is None:
+            return None
+        params = {'id': user_id, 'points': user['points'], 'n': LEADERBOARD_MAX_WINDOW}
+        
+        rank = top_users.rank_of(user_id)
+        if rank is None:
+            # Linear in the users ahead, so the count stops at LEADERBOARD_MAX_RANK
+            cursor.execute('''
+            SELECT COUNT(*) AS ahead FROM (
+                SELECT 1 FROM users WHERE points > :points
+                UNION ALL
+                SELECT 1 FROM users WHERE points = :points AND id < :id
+                LIMIT :max_rank
+            )
+            ''', {**params, 'max_rank': LEADERBOARD_MAX_RANK})
+            ahead = cursor.fetchone()['ahead']
+            rank = ahead + 1 if ahead < LEADERBOARD_MAX_RANK else None
+        
+        # Nearest first on both sides: equal points by id, then the next points values
+        cursor.execute('''
+        SELECT id, username, points FROM users WHERE points = :points AND id < :id
+        ORDER BY id DESC LIMIT :n
+        ''', params)
+        above = cursor.fetchall()
+        if len(above) < LEADERBOARD_MAX_WINDOW:
+            cursor.execute('''
+            SELECT id, username, points FROM users WHERE points > :points
+            ORDER BY points, id DESC LIMIT :n
+            ''', params)
+            above += cursor.fetchall()
+        
+        cursor.execute('''
+        SELECT id, username, points FROM users WHERE points = :points AND id > :id
+        ORDER BY id LIMIT :n
+        ''', params)
+        below = cursor.fetchall()
+        if len(below) < LEADERBOARD_MAX_WINDOW:
+            cursor.execute('''
+            SELECT id, username, points FROM users WHERE points < :points
+            ORDER BY points DESC, id LIMIT :n
+            ''', params)
+            below += cursor.fetchall()
+    
+    above = above[:LEADERBOARD_MAX_WINDOW]
+    below = below[:LEADERBOARD_MAX_WINDOW]
+    return {
+        **_leaderboard_entry(rank, user['id'], user['username'], user['points']),
+        'above': [_leaderboard_entry(rank and rank - i - 1, *row) for i, row in reversed(list(enumerate(above)))],
+        'below': [_leaderboard_entry(rank and rank + i + 1, *row) for i, row in enumerate(below)]
+    }
+
+# Dashboard sections, in the order the dashboard renders them
+DASHBOARD_SECTIONS = ('rewards', 'achievements', 'recentAchievements',
+                      'ghostModeDays', 'ghostModeSettings', 'socialPlatforms')
+
+def get_dashboard(user_id, sections=DASHBOARD_SECTIONS):
+    """Load the data behind the requested dashboard sections from one snapshot.
+    
+    The user row, ghost mode settings and ghost mode day counter come from a
+    single joined query; each list section adds one more query on the same
+    connection and read transaction.
+    """
+    try:
+        with get_db() as conn:
+            if not conn.in_transaction:
+                conn.execute('BEGIN')
+            cursor = conn.cursor()
+            cursor.execute('''
+            SELECT u.id, u.username, u.points, u.streak, u.days_strong, u.last_active_date,
+                   gs.block_messages, gs.hide_status, gs.mute_notifications, gs.hide_activity,
+                   gd.distinct_days, gd.last_day AS ghost_mode_last_day
+            FROM users u
+            LEFT JOIN ghost_mode_settings gs ON gs.user_id = u.id
+            LEFT JOIN ghost_mode_days gd ON gd.user_id = u.id
+            WHERE u.id = ?
+            ''', (user_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None, "User not found"
+            
+            row = dict(row)
+            data = {
+                'user': row,
+                'ghost_mode_settings': {
+                    'block_messages': row['block_messages'] or False,
+                    'hide_status': row['hide_status'] or False,
+                    'mute_notifications': row['mute_notifications'] or False,
+                    'hide_activity': row['hide_activity'] or False
+                },
+                'ghost_mode_days': _ghost_mode_days(user_id, row['distinct_days'], row['ghost_mode_last_day'])
+            }
+            if 'rewards' in sections:
+                data['claimed_rewards'] = get_user_claimed_rewards(user_id)
+            if 'achievements' in sections or 'recentAchievements' in sections:
+                data['achievements'] = get_user_achievements(user_id)
+            if 'socialPlatforms' in sections:
+                data['social_platforms'] = get_user_social_platforms(user_id, USER_LIST_DEFAULT_LIMIT) or []
+            return data, None
+    except sqlite3.Error as e:
+        return None, f"Database error: {str(e)}"
+
+if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Crumble database management')
+    parser.add_argument('--db', default=DATABASE_PATH, help='Path to the SQLite database')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('migrate', help='Apply pending schema migrations')
+    commands.add_parser('init', help='Apply migrations and seed default data')
+    commands.add_parser('version', help='Print the current schema version')
+    import_users = commands.add_parser('import-users', help='Stream a JSON / JSON Lines user dump into the database')
+    import_users.add_argument('file', help='users.json-style array or one user object per line')
+    import_users.add_argument('--batch-size', type=int, default=importer.BATCH_SIZE, help='Users per transaction')
+    import_users.add_argument('--rejects', help='Append rejected records here (default: <file>.rejects.jsonl)')
+    import_users.add_argument('--restart', action='store_true', help='Ignore any checkpoint and start from the top')
+    decay = commands.add_parser('decay-streaks', help='Reset lapsed streaks for all users (run daily)')
+    decay.add_argument('--date', help='Treat this YYYY-MM-DD as today (default: the local date)')
+    decay.add_argument('--chunk-size', type=int, default=maintenance.CHUNK_SIZE, help='User ids per initial transaction')
+    decay.add_argument('--restart', action='store_true', help='Ignore any checkpoint for the date')
+    args = parser.parse_args()
+    
+    DATABASE_PATH = args.db
+    if args.command == 'migrate':
+        print(f"Schema version: {migrate()}")
+    elif args.command == 'init':
+        init_db()
+        print(f"Schema version: {get_schema_version()}")
+    elif args.command == 'import-users':
+        migrate()
+        report = importer.import_users(args.file, get_db, batch_size=args.batch_size, restart=args.restart,
+                                       rejects_path=args.rejects or f'{args.file}.rejects.jsonl')
+        if report.rejected:
+            print(f"Rejected records written to {args.rejects or args.file + '.rejects.jsonl'}")
+    elif args.command == 'decay-streaks':
+        migrate()
+        maintenance.decay_streaks(get_db, today=args.date, chunk_size=args.chunk_size, restart=args.restart)
+    else:
+        print(f"Schema version: {get_schema_version()}")
@@ -0,0 +1,308 @@
+"""Streaming, batched and resumable bulk import of user dumps.
+
+Accepts the users.json layout (one top-level JSON array) or JSON Lines (one
+user object per line), parsed incrementally so a dump of millions of users
+never has to fit in memory. Users are written in batches with executemany,
+one transaction per batch, and the batch's checkpoint row is committed in
+the same transaction: after a crash the import resumes at the first
+uncommitted batch without duplicating or losing rows.
+
+    python database.py import-users partner-dump.jsonl --batch-size 5000
+"""
+import itertools
+import json
+import os
+import time
+
+BATCH_SIZE = 1000
+READ_SIZE = 64 * 1024
+# A single record larger than this means the input is not what we expect
+MAX_RECORD_SIZE = 16 * 1024 * 1024
+PROGRESS_INTERVAL = 5.0
+# Emails per IN (...) lookup, well under SQLite's bound-variable limit
+LOOKUP_CHUNK = 500
+
+class ImportFormatError(Exception):
+    """The input cannot be parsed any further"""
+
+def _iter_array(f, decoder, buffer):
+    """Yield the elements of a top-level JSON array, reading READ_SIZE chunks"""
+    pos = 1  # just past the opening '['
+    eof = False
+    count = 0
+    expect_value = True
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+            pos += 1
+        if pos >= len(buffer):
+            chunk = '' if eof else f.read(READ_SIZE)
+            if not chunk:
+                raise ImportFormatError('Unexpected end of input inside the top-level array')
+            buffer, pos = chunk, 0
+            continue
+
+        char = buffer[pos]
+        if char == ']' and (not expect_value or not count):
+            return
+        if not expect_value:
+            if char != ',':
+                raise ImportFormatError(f"Expected ',' or ']' after record {count} but found {char!r}")
+            pos += 1
+            expect_value = True
+            continue
+
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+            # A value ending exactly at the buffer end (e.g. a number) may continue
+            complete = end < len(buffer) or eof
+        except json.JSONDecodeError as e:
+            if eof:
+                raise ImportFormatError(f'Malformed JSON after record {count}: {e}') from e
+            complete = False
+        if not complete:
+            if len(buffer) - pos > MAX_RECORD_SIZE:
+                raise ImportFormatError(f'Record {count + 1} is malformed or larger than {MAX_RECORD_SIZE} bytes')
+            chunk = f.read(READ_SIZE)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+
+        count += 1
+        yield value
+        pos = end
+        expect_value = False
+
+def iter_records(f):
+    """Yield (record number, record, error) from a JSON array or JSON Lines file.
+
+    Malformed JSON Lines entries are reported individually and skipped; a
+    malformed array raises ImportFormatError since it cannot be resynchronised.
+    """
+    buffer = ''
+    while not buffer.strip():
+        chunk = f.read(READ_SIZE)
+        if not chunk:
+            return
+        buffer += chunk
+    buffer = buffer.lstrip()
+
+    if buffer.startswith('['):
+        for number, value in enumerate(_iter_array(f, json.JSONDecoder(), buffer), 1):
+            yield number, value, None
+        return
+
+    # JSON Lines: finish the partially read line, then stream the rest line by line
+    head = (buffer + f.readline()).splitlines()
+    for number, line in enumerate(itertools.chain(head, f), 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line), None
+        except ValueError as e:
+            yield number, None, f'Malformed JSON: {e}'
+
+def validate(record):
+    """Normalise one user record, returning (user, error)"""
+    if not isinstance(record, dict):
+        return None, 'Record is not an object'
+    for field in ('username', 'email', 'password'):
+        if not isinstance(record.get(field), str) or not record[field]:
+            return None, f"Missing or invalid '{field}'"
+    if record.get('id') is not None and (not isinstance(record['id'], int) or isinstance(record['id'], bool)):
+        return None, "Invalid 'id'"
+    for field in ('points', 'streak', 'days_strong'):
+        value = record.get(field, 0)
+        if value is None:
+            value = 0
+        if not isinstance(value, int) or isinstance(value, bool):
+            return None, f"Invalid '{field}'"
+        record[field] = value
+
+    rewards = record.get('rewards') or []
+    platforms = record.get('connected_platforms') or []
+    settings = record.get('ghost_mode_settings')
+    if not isinstance(rewards, list) or not all(isinstance(r, int) for r in rewards):
+        return None, "Invalid 'rewards'"
+    if not isinstance(platforms, list) or not all(isinstance(p, dict) and p.get('name') for p in platforms):
+        return None, "Invalid 'connected_platforms'"
+    if settings is not None and not isinstance(settings, dict):
+        return None, "Invalid 'ghost_mode_settings'"
+
+    record['rewards'] = rewards
+    record['connected_platforms'] = platforms
+    return record, None
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+class ImportReport:
+    """Counters for one import run"""
+    def __init__(self, source, resumed_from=0):
+        self.source = source
+        self.resumed_from = resumed_from
+        self.records = resumed_from
+        self.imported = 0
+        self.existing = 0
+        self.rejected = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self):
+        processed = self.records - self.resumed_from
+        return processed / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        return (f"{self.source}: {self.records} records, {self.imported} imported, "
+                f"{self.existing} already present, {self.rejected} rejected "
+                f"in {self.elapsed:.1f}s ({self.rate:.0f} rows/sec)")
+
+def _load_checkpoint(conn, source, fingerprint):
+    row = conn.execute('''
+    SELECT fingerprint, records, completed FROM import_checkpoints WHERE source = ?
+    ''', (source,)).fetchone()
+    if row is None or row['fingerprint'] != fingerprint:
+        return 0, False
+    return row['records'], bool(row['completed'])
+
+def _save_checkpoint(conn, source, fingerprint, records, completed=False):
+    conn.execute('''
+    INSERT INTO import_checkpoints (source, fingerprint, records, completed, updated_at)
+    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT (source) DO UPDATE SET
+        fingerprint = excluded.fingerprint,
+        records = excluded.records,
+        completed = excluded.completed,
+        updated_at = excluded.updated_at
+    ''', (source, fingerprint, records, int(completed)))
+
+def _lookup(conn, sql, values):
+    """Run sql ('... IN ({})') over values in chunks that stay below SQLite's variable limit"""
+    rows = []
+    for i in range(0, len(values), LOOKUP_CHUNK):
+        chunk = values[i:i + LOOKUP_CHUNK]
+        rows.extend(conn.execute(sql.format(','.join('?' * len(chunk))), chunk))
+    return rows
+
+def _write_batch(conn, batch):
+    """Insert one batch of validated users, returning (imported, existing, rejected)"""
+    # The first occurrence of an email wins, within the batch and against the table
+    by_email = {}
+    for number, user in batch:
+        by_email.setdefault(user['email'], (number, user))
+    present = {row['email'] for row in _lookup(conn, 'SELECT email FROM users WHERE email IN ({})', list(by_email))}
+    new = [entry for email, entry in by_email.items() if email not in present]
+
+    conn.executemany('''
+    INSERT OR IGNORE INTO users (id, username, email, password, points, streak, days_strong, last_active_date)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(user.get('id'), user['username'], user['email'], user['password'], user['points'],
+           user['streak'], user['days_strong'], user.get('last_active_date')) for _, user in new])
+
+    # Resolve the ids actually assigned; a record whose explicit id belongs to
+    # another account was ignored above and is rejected here
+    ids = {row['email']: row['id'] for row in _lookup(
+        conn, 'SELECT id, email FROM users WHERE email IN ({})', [user['email'] for _, user in new])}
+
+    rewards, settings, platforms, rejected = [], [], [], []
+    for number, user in new:
+        user_id = ids.get(user['email'])
+        if user_id is None:
+            rejected.append((number, user, f"User id {user.get('id')} is already taken"))
+            continue
+        rewards.extend((user_id, reward_id) for reward_id in user['rewards'])
+        if user.get('ghost_mode_settings') is not None:
+            ghost = user['ghost_mode_settings']
+            settings.append((user_id, ghost.get('blockMessages', 0), ghost.get('hideStatus', 0),
+                             ghost.get('muteNotifications', 0), ghost.get('hideActivity', 0)))
+        platforms.extend((user_id, platform['name'], platform.get('username', ''))
+                         for platform in user['connected_platforms'])
+
+    conn.executemany('INSERT OR IGNORE INTO user_rewards (user_id, reward_id) VALUES (?, ?)', rewards)
+    conn.executemany('''
+    INSERT OR IGNORE INTO ghost_mode_settings
+    (user_id, block_messages, hide_status, mute_notifications, hide_activity)
+    VALUES (?, ?, ?, ?, ?)
+    ''', settings)
+    conn.executemany('''
+    INSERT OR IGNORE INTO social_platforms (user_id, platform_name, username)
+    VALUES (?, ?, ?)
+    ''', platforms)
+
+    return len(new) - len(rejected), len(batch) - len(new), rejected
+
+def import_users(path, get_db, batch_size=BATCH_SIZE, restart=False, rejects_path=None, verbose=True):
+    """Import a user dump into the database and return an ImportReport.
+
+    get_db is database.get_db, passed in so the importer writes to whichever
+    database the caller has configured. Rejected records are appended to
+    rejects_path as JSON Lines when given. An unchanged, fully imported file
+    is skipped unless restart is set.
+    """
+    source = os.path.abspath(path)
+    fingerprint = _fingerprint(source)
+
+    with get_db() as conn:
+        skip, completed = (0, False) if restart else _load_checkpoint(conn, source, fingerprint)
+    report = ImportReport(path, resumed_from=skip)
+    if completed:
+        if verbose:
+            print(f"{path}: already imported ({skip} records)")
+        return report
+    if skip and verbose:
+        print(f"{path}: resuming after record {skip}")
+
+    rejects = open(rejects_path, 'a', encoding='utf-8') if rejects_path else None
+
+    def flush(batch, rejected, position):
+        # Rejects are only written once their batch has committed, so a
+        # resumed run never reports the same record twice
+        with get_db() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            if batch:
+                imported, existing, conflicts = _write_batch(conn, batch)
+                report.imported += imported
+                report.existing += existing
+                rejected = rejected + conflicts
+            _save_checkpoint(conn, source, fingerprint, position)
+        report.rejected += len(rejected)
+        if rejects:
+            for number, record, reason in rejected:
+                rejects.write(json.dumps({'record': number, 'reason': reason, 'data': record}) + '\n')
+            rejects.flush()
+
+    last_progress = time.perf_counter()
+    try:
+        with open(source, 'r', encoding='utf-8') as f:
+            batch, rejected = [], []
+            for number, record, error in iter_records(f):
+                if number <= skip:
+                    continue
+                report.records = number
+                user, error = (None, error) if error else validate(record)
+                if error:
+                    rejected.append((number, record, error))
+                else:
+                    batch.append((number, user))
+
+                if len(batch) + len(rejected) >= batch_size:
+                    flush(batch, rejected, number)
+                    batch, rejected = [], []
+                    if verbose and time.perf_counter() - last_progress >= PROGRESS_INTERVAL:
+                        last_progress = time.perf_counter()
+                        print(f"  {report.records} records ({report.rate:.0f} rows/sec)")
+            flush(batch, rejected, report.records)
+
+        with get_db() as conn:
+            _save_checkpoint(conn, source, fingerprint, report.records, completed=True)
+    finally:
+        if rejects:
+            rejects.close()
+
+    if verbose:
+        print(report.summary())
+    return report
@@ -0,0 +1,85 @@
+"""In-memory top-K of the points leaderboard.
+
+Ranking is by points (highest first), ties broken by the lower user id,
+matching the idx_users_points index. Each worker keeps the best K users
+sorted in memory. update_user_points() feeds it every change, and it is
+reloaded from the index every refresh_interval seconds so changes made by
+other workers also show up. An update that might pull in a user this worker
+has never seen (a member dropping out of the top K) marks it stale instead.
+"""
+import bisect
+import threading
+import time
+
+LEADERBOARD_SIZE = 100
+REFRESH_INTERVAL = 5.0
+
+class TopK:
+    """The K best (points, id) entries, sorted, with usernames"""
+    def __init__(self, size=LEADERBOARD_SIZE, refresh_interval=REFRESH_INTERVAL):
+        self.size = size
+        self.refresh_interval = refresh_interval
+        self._keys = []   # sorted (-points, user_id)
+        self._users = {}  # user_id -> (username, points)
+        self._loaded_at = None
+        self._source = None
+        self._lock = threading.Lock()
+
+    def is_stale(self, source):
+        """Whether the entries must be reloaded before use (source names the database)"""
+        return (self._loaded_at is None or self._source != source
+                or time.monotonic() - self._loaded_at >= self.refresh_interval)
+
+    def load(self, rows, source):
+        """Replace the entries with rows of (id, username, points), best first"""
+        with self._lock:
+            self._keys = [(-points, user_id) for user_id, _, points in rows]
+            self._users = {user_id: (username, points) for user_id, username, points in rows}
+            self._loaded_at = time.monotonic()
+            self._source = source
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def update(self, user_id, username, points):
+        """Apply one user's new points total"""
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            full = len(self._keys) >= self.size
+            previous = self._users.pop(user_id, None)
+            if previous is not None:
+                del self._keys[bisect.bisect_left(self._keys, (-previous[1], user_id))]
+
+            key = (-points, user_id)
+            if not full or (self._keys and key < self._keys[-1]):
+                bisect.insort(self._keys, key)
+                self._users[user_id] = (username, points)
+                if len(self._keys) > self.size:
+                    _, dropped = self._keys.pop()
+                    del self._users[dropped]
+            elif previous is not None:
+                # A member fell to the bottom; whoever replaces it is unknown here
+                self._loaded_at = None
+
+    def page(self, after, limit):
+        """[(rank, user_id, username, points)] after the (points, user_id) key `after`
+        (from the top if None), or None if the page is not covered"""
+        with self._lock:
+            if self._loaded_at is None:
+                return None
+            start = 0 if after is None else bisect.bisect_right(self._keys, (-after[0], after[1]))
+            # Past the end of a full board the answer lives in the database
+            if start + limit > len(self._keys) and len(self._keys) >= self.size:
+                return None
+            return [(start + i + 1, user_id, *self._users[user_id])
+                    for i, (_, user_id) in enumerate(self._keys[start:start + limit])]
+
+    def rank_of(self, user_id):
+        """A member's 1-based rank, or None if the user is not in the top K"""
+        with self._lock:
+            entry = self._users.get(user_id) if self._loaded_at is not None else None
+            if entry is None:
+                return None
+            return bisect.bisect_left(self._keys, (-entry[1], user_id)) + 1
@@ -0,0 +1,145 @@
+"""Scheduled maintenance of the per-user day counters.
+
+update_user_points() only moves a user's streak when that user earns
+points, so someone who stops coming back would keep their streak forever.
+decay_streaks() is the nightly catch-up for everyone else. It runs
+set-based UPDATEs over ranges of user ids. Each chunk is its own short
+write transaction, and the chunk's checkpoint row commits with it. The
+chunk size adapts to keep each transaction near TARGET_LOCK_SECONDS, so
+app writes are never queued for long. An interrupted run resumes at the
+first uncommitted chunk.
+
+    python database.py decay-streaks            # e.g. from cron, shortly after midnight
+"""
+import datetime
+import time
+
+import achievements
+
+JOB_NAME = 'decay-streaks'
+CHUNK_SIZE = 20000
+MIN_CHUNK_SIZE = 1000
+MAX_CHUNK_SIZE = 500000
+# Aim for write transactions about this long
+TARGET_LOCK_SECONDS = 0.05
+PROGRESS_INTERVAL = 5.0
+
+# A streak survives only while the last active day is today or yesterday
+# (the same rule update_user_points applies). days_strong counts active
+# days, so it is never allowed to fall below the streak it has seen. Raising
+# it can unlock days_strong achievements, so the changed rows are returned
+# for the achievement rules to run on.
+DECAY_STREAKS_SQL = '''
+UPDATE users SET
+    streak = CASE
+        WHEN last_active_date IS NULL OR julianday(:today) - julianday(last_active_date) > 1 THEN 0
+        ELSE streak
+    END,
+    days_strong = MAX(days_strong, streak)
+WHERE id > :start AND id <= :end
+  AND ((streak > 0 AND (last_active_date IS NULL OR julianday(:today) - julianday(last_active_date) > 1))
+       OR days_strong < streak)
+RETURNING id, days_strong
+'''
+
+class JobReport:
+    """Counters and timings for one run"""
+    def __init__(self, job, run_date, resumed_from=0, updated=0):
+        self.job = job
+        self.run_date = run_date
+        self.resumed_from = resumed_from
+        self.last_id = resumed_from
+        self.chunks = 0
+        self.updated = updated
+        self.lock_seconds = 0.0
+        self.max_lock_seconds = 0.0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def record_chunk(self, last_id, updated, seconds):
+        self.last_id = last_id
+        self.chunks += 1
+        self.updated += updated
+        self.lock_seconds += seconds
+        self.max_lock_seconds = max(self.max_lock_seconds, seconds)
+
+    def summary(self):
+        average = self.lock_seconds / self.chunks if self.chunks else 0.0
+        return (f"{self.job} for {self.run_date}: {self.updated} users updated up to id {self.last_id} "
+                f"in {self.elapsed:.1f}s, {self.chunks} chunks "
+                f"(write lock avg {average * 1000:.1f}ms, max {self.max_lock_seconds * 1000:.1f}ms)")
+
+def _load_checkpoint(conn, job, run_date):
+    row = conn.execute('''
+    SELECT last_id, updated, completed FROM job_checkpoints WHERE job = ? AND run_date = ?
+    ''', (job, run_date)).fetchone()
+    if row is None:
+        return 0, 0, False
+    return row['last_id'], row['updated'], bool(row['completed'])
+
+def _save_checkpoint(conn, job, run_date, last_id, updated, completed=False):
+    conn.execute('''
+    INSERT INTO job_checkpoints (job, run_date, last_id, updated, completed, updated_at)
+    VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT (job, run_date) DO UPDATE SET
+        last_id = excluded.last_id,
+        updated = excluded.updated,
+        completed = excluded.completed,
+        updated_at = excluded.updated_at
+    ''', (job, run_date, last_id, updated, int(completed)))
+
+def decay_streaks(get_db, today=None, chunk_size=CHUNK_SIZE, restart=False, verbose=True):
+    """Reset lapsed streaks for every user and return a JobReport.
+
+    get_db is database.get_db. today is a 'YYYY-MM-DD' string (default: the
+    local date, as in update_user_points). A run that has already finished
+    for that date is skipped unless restart is set.
+    """
+    today = today or datetime.datetime.now().strftime('%Y-%m-%d')
+    with get_db() as conn:
+        start, updated, completed = (0, 0, False) if restart else _load_checkpoint(conn, JOB_NAME, today)
+        max_id = conn.execute('SELECT MAX(id) FROM users').fetchone()[0] or 0
+    report = JobReport(JOB_NAME, today, resumed_from=start, updated=updated)
+    if completed:
+        if verbose:
+            print(f"{JOB_NAME}: already ran for {today}")
+        return report
+    if start and verbose:
+        print(f"{JOB_NAME}: resuming after user id {start}")
+
+    last_progress = time.perf_counter()
+    while start < max_id:
+        end = min(start + chunk_size, max_id)
+        with get_db() as conn:
+            # Take the write lock up front so the timing covers the whole hold
+            conn.execute('BEGIN IMMEDIATE')
+            began = time.perf_counter()
+            rows = conn.execute(DECAY_STREAKS_SQL, {'today': today, 'start': start, 'end': end}).fetchall()
+            # Awards commit with the chunk that earned them
+            for row in rows:
+                achievements.evaluate(conn, row['id'], {'days_strong': row['days_strong']})
+            updated = len(rows)
+            _save_checkpoint(conn, JOB_NAME, today, end, report.updated + updated)
+        seconds = time.perf_counter() - began
+        report.record_chunk(end, updated, seconds)
+        start = end
+
+        # Steer the next chunk towards the target write-lock time
+        if seconds < TARGET_LOCK_SECONDS / 2:
+            chunk_size = min(MAX_CHUNK_SIZE, chunk_size * 2)
+        elif seconds > TARGET_LOCK_SECONDS:
+            chunk_size = max(MIN_CHUNK_SIZE, chunk_size // 2)
+
+        if verbose and time.perf_counter() - last_progress >= PROGRESS_INTERVAL:
+            last_progress = time.perf_counter()
+            print(f"  up to id {end} of {max_id}, {report.updated} updated")
+
+    with get_db() as conn:
+        _save_checkpoint(conn, JOB_NAME, today, report.last_id, report.updated, completed=True)
+
+    if verbose:
+        print(report.summary())
+    return report
@@ -0,0 +1,276 @@
+"""In-process counters and histograms exported in Prometheus text format.
+
+Every worker records into its own registry. When CRUMBLE_METRICS_DIR is set
+(it must be shared by all gunicorn workers of one deployment) each worker
+also snapshots its registry to <dir>/metrics-<pid>.json every few seconds,
+and /metrics sums the snapshots of all workers with its own live values.
+Without it, /metrics reports the serving process only.
+
+A snapshot not rewritten for STALE_AFTER seconds belongs to a worker that
+is gone (recycled by max_requests, crashed). Its counts are folded into
+metrics-retired.json and the file is removed. The directory therefore stays
+the size of the live worker set, and totals never go backwards.
+"""
+import atexit
+import bisect
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+
+METRICS_DIR = os.environ.get('CRUMBLE_METRICS_DIR')
+SNAPSHOT_INTERVAL = 5.0
+STALE_AFTER = 60.0
+RETIRED_NAME = 'metrics-retired.json'
+
+# Upper bounds (seconds) for latency histograms
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Registry:
+    """Thread-safe store of labelled counters and histograms"""
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, kind, help_text):
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name, labels, amount=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # Per-bucket (non-cumulative) counts, the last slot being +Inf
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def snapshot(self):
+        """A JSON-serializable copy of every series"""
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value]
+                             for (name, labels), value in self._counters.items()],
+                'histograms': [[name, list(labels), list(counts), total, count]
+                               for (name, labels), (counts, total, count) in self._histograms.items()],
+            }
+
+def merge(snapshots):
+    """Sum several snapshots into ({counter key: value}, {histogram key: [counts, sum, count]})"""
+    counters = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot.get('counters', []):
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, counts, total, count in snapshot.get('histograms', []):
+            key = (name, tuple(tuple(pair) for pair in labels))
+            merged = histograms.get(key)
+            if merged is None:
+                histograms[key] = [list(counts), total, count]
+            else:
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+    return counters, histograms
+
+def as_snapshot(counters, histograms):
+    """The snapshot form of merge()'s output"""
+    return {
+        'counters': [[name, [list(pair) for pair in labels], value]
+                     for (name, labels), value in counters.items()],
+        'histograms': [[name, [list(pair) for pair in labels], counts, total, count]
+                       for (name, labels), (counts, total, count) in histograms.items()],
+    }
+
+def _read_snapshot(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_json(path, data):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metrics:
+    """The process-wide registry plus cross-worker snapshot files"""
+    def __init__(self, metrics_dir=METRICS_DIR, interval=SNAPSHOT_INTERVAL, stale_after=STALE_AFTER):
+        self.registry = Registry()
+        self.metrics_dir = metrics_dir
+        self.interval = interval
+        self.stale_after = stale_after
+        self._writer_pid = None
+        self._writer_lock = threading.Lock()
+
+        self.registry.describe('crumble_http_requests_total', 'counter',
+                               'HTTP requests by route, method and status')
+        self.registry.describe('crumble_http_request_duration_seconds', 'histogram',
+                               'HTTP request latency by route, method and status')
+        self.registry.describe('crumble_db_queries_total', 'counter',
+                               'SQL statements executed, by calling function')
+        self.registry.describe('crumble_db_query_errors_total', 'counter',
+                               'SQL statements that raised, by calling function')
+        self.registry.describe('crumble_db_query_duration_seconds', 'histogram',
+                               'SQL statement execution time, by calling function')
+        self.registry.describe('crumble_cache_lookups_total', 'counter',
+                               'Cache lookups by cache, tier and result')
+
+    # Recording
+    def observe_request(self, route, method, status, seconds):
+        labels = (('route', route), ('method', method), ('status', str(status)))
+        self.registry.inc('crumble_http_requests_total', labels)
+        self.registry.observe('crumble_http_request_duration_seconds', labels, seconds)
+        self._ensure_writer()
+
+    def observe_query(self, function, seconds, failed=False):
+        labels = (('function', function),)
+        self.registry.inc('crumble_db_queries_total', labels)
+        if failed:
+            self.registry.inc('crumble_db_query_errors_total', labels)
+        self.registry.observe('crumble_db_query_duration_seconds', labels, seconds)
+        self._ensure_writer()
+
+    def observe_cache(self, cache, tier, hit):
+        labels = (('cache', cache), ('tier', tier), ('result', 'hit' if hit else 'miss'))
+        self.registry.inc('crumble_cache_lookups_total', labels)
+        self._ensure_writer()
+
+    # Cross-worker snapshots
+    def _snapshot_path(self, pid=None):
+        return os.path.join(self.metrics_dir, f'metrics-{pid or os.getpid()}.json')
+
+    def write_snapshot(self):
+        """Persist this worker's registry for the other workers to read"""
+        if not self.metrics_dir or self._writer_pid != os.getpid():
+            return
+        try:
+            _write_json(self._snapshot_path(), self.registry.snapshot())
+        except OSError as e:
+            print(f"Metrics snapshot failed: {e}")
+
+    def fold_stale(self, now=None):
+        """Fold snapshots of workers that stopped writing into the retired file"""
+        if not self.metrics_dir:
+            return 0
+        now = time.time() if now is None else now
+        retired_path = os.path.join(self.metrics_dir, RETIRED_NAME)
+        try:
+            # One folder at a time, or two workers could both count a dead one
+            with open(os.path.join(self.metrics_dir, '.fold.lock'), 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                stale = []
+                for path in glob.glob(os.path.join(self.metrics_dir, 'metrics-*')):
+                    if path in (retired_path, self._snapshot_path()):
+                        continue
+                    try:
+                        if now - os.path.getmtime(path) >= self.stale_after:
+                            stale.append(path)
+                    except OSError:
+                        continue
+                if not stale:
+                    return 0
+                # Leftover .tmp files of killed writers are just removed
+                snapshots = [_read_snapshot(path) for path in stale if path.endswith('.json')]
+                retired = _read_snapshot(retired_path) or {}
+                snapshots = [retired] + [snapshot for snapshot in snapshots if snapshot]
+                _write_json(retired_path, as_snapshot(*merge(snapshots)))
+                for path in stale:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                return len(stale)
+        except OSError as e:
+            print(f"Metrics fold failed: {e}")
+            return 0
+
+    def _ensure_writer(self):
+        # Started lazily so every forked worker gets its own writer thread
+        if not self.metrics_dir or self._writer_pid == os.getpid():
+            return
+        with self._writer_lock:
+            if self._writer_pid == os.getpid():
+                return
+            os.makedirs(self.metrics_dir, exist_ok=True)
+            self._writer_pid = os.getpid()
+            thread = threading.Thread(target=self._write_loop, name='metrics-writer', daemon=True)
+            thread.start()
+
+    def _write_loop(self):
+        while True:
+            time.sleep(self.interval)
+            self.write_snapshot()
+            self.fold_stale()
+
+    def collect(self):
+        """Merge this worker's live values with every other worker's snapshot"""
+        snapshots = [self.registry.snapshot()]
+        if self.metrics_dir:
+            own = self._snapshot_path()
+            for path in glob.glob(os.path.join(self.metrics_dir, 'metrics-*.json')):
+                if path == own:
+                    continue
+                snapshot = _read_snapshot(path)
+                if snapshot is not None:
+                    snapshots.append(snapshot)
+        return merge(snapshots)
+
+    def render(self):
+        """Prometheus text exposition (format 0.0.4) of the merged metrics"""
+        counters, histograms = self.collect()
+        buckets = self.registry.buckets + (float('inf'),)
+        lines = []
+
+        names = sorted({name for name, _ in counters} | {name for name, _ in histograms})
+        for name in names:
+            kind, help_text = self.registry._help.get(name, ('untyped', ''))
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for (series, labels), value in sorted(counters.items()):
+                if series == name:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_number(value)}')
+            for (series, labels), (counts, total, count) in sorted(histograms.items()):
+                if series != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    le = (('le', _format_number(bound)),)
+                    lines.append(f'{name}_bucket{_format_labels(labels, le)} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_number(total)}')
+                lines.append(f'{name}_count{_format_labels(labels)} {count}')
+
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+atexit.register(metrics.write_snapshot)
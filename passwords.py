@@ -0,0 +1,132 @@
+"""Password hashing and verification on a dedicated process pool.
+
+The KDFs are deliberately expensive, so running them inline would let a burst
+of logins starve every other route on a worker. Work is handed to a small
+process pool behind a bounded queue; when the queue is full callers get
+PoolSaturated immediately and should answer 503 with Retry-After.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# KDF for new hashes, in werkzeug's fully specified method syntax,
+# e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'. Stored hashes made with
+# anything else are upgraded on the user's next successful login.
+PASSWORD_METHOD = os.environ.get('CRUMBLE_PASSWORD_METHOD', 'scrypt:32768:8:1')
+SALT_LENGTH = 16
+
+# Hashing processes per app worker; 0 hashes inline (handy for local
+# development). Every gunicorn worker gets its own pool, so keep
+# workers x CRUMBLE_HASH_WORKERS near the host's core count.
+HASH_WORKERS = int(os.environ.get('CRUMBLE_HASH_WORKERS', '2'))
+HASH_QUEUE_SIZE = int(os.environ.get('CRUMBLE_HASH_QUEUE_SIZE', max(1, HASH_WORKERS) * 4))
+HASH_TIMEOUT = float(os.environ.get('CRUMBLE_HASH_TIMEOUT', '10'))
+RETRY_AFTER = 1
+# The pool starts from a request thread, after the ghost log flusher and other
+# threads are running; a plain fork could copy a lock one of them holds
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+class PoolSaturated(Exception):
+    """The hashing queue is full (or timed out); the caller should shed the request"""
+    def __init__(self, retry_after=RETRY_AFTER):
+        super().__init__('Password hashing pool is saturated')
+        self.retry_after = retry_after
+
+def _hash(password, method, salt_length):
+    return generate_password_hash(password, method=method, salt_length=salt_length)
+
+def _check(pwhash, password):
+    try:
+        return check_password_hash(pwhash, password)
+    except (ValueError, TypeError):
+        # Malformed or legacy placeholder hashes never match
+        return False
+
+class HashingPool:
+    """A process pool with a bounded number of queued + running jobs"""
+    def __init__(self, workers=HASH_WORKERS, queue_size=HASH_QUEUE_SIZE, timeout=HASH_TIMEOUT):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._slots = None
+
+    def _ensure_started(self):
+        # Created lazily, and again after a fork, so each worker owns its pool
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context(START_METHOD))
+                self._slots = threading.BoundedSemaphore(self.queue_size)
+                self._pid = os.getpid()
+
+    def submit(self, fn, *args):
+        """Queue fn(*args) on the pool and return its concurrent Future"""
+        if self.workers <= 0:
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        self._ensure_started()
+        if not self._slots.acquire(blocking=False):
+            raise PoolSaturated()
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, fn, *args):
+        """Run fn(*args) in the pool and wait for the result"""
+        try:
+            return self.submit(fn, *args).result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise PoolSaturated()
+
+    async def run_async(self, fn, *args):
+        """Await fn(*args) in the pool without blocking the event loop"""
+        future = asyncio.wrap_future(self.submit(fn, *args))
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            raise PoolSaturated()
+
+    def shutdown(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._pid = None
+
+pool = HashingPool()
+
+def hash_password(password):
+    """Hash a password with the configured KDF (raises PoolSaturated)"""
+    return pool.run(_hash, password, PASSWORD_METHOD, SALT_LENGTH)
+
+def verify_password(pwhash, password):
+    """Check a password against a stored hash (raises PoolSaturated)"""
+    return pool.run(_check, pwhash, password)
+
+async def hash_password_async(password):
+    """hash_password for asyncio callers"""
+    return await pool.run_async(_hash, password, PASSWORD_METHOD, SALT_LENGTH)
+
+async def verify_password_async(pwhash, password):
+    """verify_password for asyncio callers"""
+    return await pool.run_async(_check, pwhash, password)
+
+def needs_rehash(pwhash):
+    """Whether a stored hash was made with different KDF parameters"""
+    return pwhash.split('$', 1)[0] != PASSWORD_METHOD
@@ -0,0 +1,148 @@
+"""Magic quiz scoring: which breakup method and tone suit a set of answers.
+
+Every option of every question carries a weight vector over the breakup
+methods and the message tones. A submission's score is the sum of the
+vectors of the options it picked. The best method and the best tone are
+the argmax over their halves of the score. Scoring is done with NumPy for a
+whole batch of submissions at once.
+
+The answer space is small (four options to five questions, plus "skipped"),
+so every possible submission is scored once when the engine is built.
+Scoring a submission then comes down to encoding its answers as an index
+into that table.
+"""
+import itertools
+
+import numpy as np
+
+METHODS = ('text', 'call', 'emoji')
+TONES = ('classic', 'gentle', 'blunt', 'humorous')
+DIMENSIONS = METHODS + TONES
+
+# Largest answer space worth precomputing; bigger quizzes score on the fly
+MAX_TABLE_SIZE = 1 << 16
+
+# Weights by option position (Option1..Option4), used for any question
+# without its own entry below: direct, voice, written, playful
+POSITION_WEIGHTS = (
+    # text call emoji | classic gentle blunt humorous
+    (1.0, 2.0, 0.0,     1.0, 0.0, 2.0, 0.0),
+    (0.5, 3.0, 0.0,     1.0, 1.0, 0.5, 0.0),
+    (3.0, 0.0, 0.5,     1.0, 1.5, 0.0, 0.0),
+    (0.5, 0.0, 3.0,     0.0, 0.0, 0.0, 2.5),
+)
+
+QUESTION_WEIGHTS = {
+    'How dramatic do you want this breakup to be?': (
+        (2.0, 1.0, 0.0,     1.0, 2.0, 0.0, 0.0),
+        (1.0, 2.0, 0.0,     2.0, 0.0, 1.0, 0.0),
+        (0.0, 3.0, 0.5,     0.0, 0.0, 3.0, 0.0),
+        (0.5, 0.0, 3.0,     0.0, 0.0, 0.0, 3.0),
+    ),
+    'How comfortable are you with confrontation?': (
+        (0.0, 3.0, 0.0,     1.0, 0.0, 2.0, 0.0),
+        (1.0, 2.0, 0.0,     2.0, 1.0, 0.0, 0.0),
+        (2.5, 0.0, 0.5,     0.0, 2.0, 0.0, 0.0),
+        (2.0, 0.0, 2.0,     0.0, 1.0, 0.0, 1.0),
+    ),
+}
+
+class RecommendationError(ValueError):
+    """A submission does not fit the quiz"""
+
+class QuizRecommender:
+    """Scores submissions against one version of the quiz (a list of {'question', 'options'})"""
+    def __init__(self, questions):
+        self.questions = questions
+        self.num_questions = len(questions)
+        self.num_options = max((len(q['options']) for q in questions), default=0)
+        # Index num_options means "skipped" and has an all-zero weight vector
+        self.base = self.num_options + 1
+
+        weights = np.zeros((self.num_questions, self.base, len(DIMENSIONS)), dtype=np.float64)
+        for i, question in enumerate(questions):
+            rows = QUESTION_WEIGHTS.get(question['question'], POSITION_WEIGHTS)
+            for j in range(len(question['options'])):
+                weights[i, j] = rows[j % len(rows)]
+        self.weights = weights
+        self._option_index = [{option: j for j, option in enumerate(q['options'])} for q in questions]
+        self._option_counts = np.array([len(q['options']) for q in questions], dtype=np.int64)
+        self._place = self.base ** np.arange(self.num_questions, dtype=np.int64)
+
+        self.table = None
+        if self.base ** self.num_questions <= MAX_TABLE_SIZE:
+            # Every possible submission, in the order encode() numbers them
+            codes = np.arange(self.base ** self.num_questions, dtype=np.int64)
+            self.table = self._score(codes[:, None] // self._place % self.base)
+
+    def _score(self, answers):
+        """(N, D) scores for an (N, Q) array of option indices"""
+        return self.weights[np.arange(self.num_questions), answers].sum(axis=1)
+
+    def _option(self, question, answer):
+        if answer is None:
+            return self.num_options
+        if isinstance(answer, str):
+            index = self._option_index[question].get(answer)
+            if index is None:
+                raise RecommendationError(f'Unknown answer to question {question + 1}')
+            return index
+        if isinstance(answer, int) and not isinstance(answer, bool):
+            if 0 <= answer < len(self.questions[question]['options']):
+                return answer
+        raise RecommendationError(f'Invalid answer to question {question + 1}')
+
+    def encode(self, submissions):
+        """An (N, Q) array of option indices; answers are indices, option texts or None"""
+        # Fast path: a batch of plain option indices is validated in one go
+        try:
+            answers = np.array(submissions)
+        except ValueError:
+            answers = None
+        # NumPy stores True as 1 next to ints, so booleans must be ruled out separately
+        if (answers is not None and answers.dtype.kind == 'i'
+                and answers.shape == (len(submissions), self.num_questions)
+                and bool not in map(type, itertools.chain.from_iterable(submissions))
+                and ((answers >= 0) & (answers < self._option_counts)).all()):
+            return answers.astype(np.int64, copy=False)
+
+        answers = np.empty((len(submissions), self.num_questions), dtype=np.int64)
+        for n, submission in enumerate(submissions):
+            try:
+                answers[n] = self.encode_submission(submission)
+            except RecommendationError as e:
+                raise RecommendationError(f'Submission {n}: {e}') from None
+        return answers
+
+    def encode_submission(self, submission, allow_skipped=True):
+        """The option indices for one submission"""
+        if not isinstance(submission, list) or len(submission) != self.num_questions:
+            raise RecommendationError(f'Answer all {self.num_questions} questions')
+        answers = [self._option(i, answer) for i, answer in enumerate(submission)]
+        if not allow_skipped and self.num_options in answers:
+            raise RecommendationError(f'Question {answers.index(self.num_options) + 1} must be answered')
+        return answers
+
+    def score(self, submissions):
+        """(N, D) score matrix for a batch of submissions"""
+        answers = self.encode(submissions)
+        if self.table is not None:
+            return self.table[answers @ self._place]
+        return self._score(answers)
+
+    def recommend(self, submissions):
+        """The recommended method and tone, with method scores, for each submission"""
+        scores = self.score(submissions)
+        methods = scores[:, :len(METHODS)]
+        best_methods = methods.argmax(axis=1)
+        best_tones = scores[:, len(METHODS):].argmax(axis=1)
+        totals = methods.sum(axis=1, keepdims=True)
+        shares = np.divide(methods, totals, out=np.zeros_like(methods), where=totals > 0)
+        return [
+            {
+                'method': METHODS[method],
+                'tone': TONES[tone],
+                'scores': dict(zip(METHODS, np.round(share, 3).tolist()))
+            }
+            for method, tone, share in zip(best_methods.tolist(), best_tones.tolist(), shares)
+        ]
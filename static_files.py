@@ -0,0 +1,195 @@
+"""Manifest-based serving of the built frontend in public/.
+
+The directory is walked once at startup: every file gets a content hash, a
+content type and its precompressed .br/.gz siblings (created next to the file
+when missing or stale). Requests are answered from that manifest alone, so
+serving never stats the filesystem. Hashed build output (assets/index-<hash>.js)
+is cached forever; everything else is revalidated with its ETag.
+
+Run `python static_files.py` after `npm run build` to precompress ahead of
+deploy instead of on the first start.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+
+from werkzeug.wsgi import wrap_file
+from flask import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'public')
+INDEX_FILE = 'index.html'
+
+# Vite names build output <name>-<8+ hex chars>.<ext>; those never change in place
+HASHED_NAME = re.compile(r'[-.][0-9a-f]{8,}\.[A-Za-z0-9]+$')
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'public, no-cache'
+
+# Only text-like files are worth compressing, and tiny ones are not
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml',
+                      'application/xml', 'application/manifest+json')
+MIN_COMPRESS_SIZE = 256
+ENCODINGS = ('br', 'gzip')  # server preference order
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+# Files that may change in place (index.html) are snapshotted into memory so
+# their bytes and ETag always agree; larger ones are streamed from disk
+MAX_MEMORY_SIZE = 256 * 1024
+
+class StaticVariant:
+    """One encoding of a file: in-memory bytes or a path to stream"""
+    def __init__(self, size, path=None, body=None):
+        self.size = size
+        self.path = path
+        self.body = body
+
+class StaticAsset:
+    """A servable file: content type, ETag, caching policy and its encodings"""
+    def __init__(self, url_path, content_type, digest, immutable):
+        self.url_path = url_path
+        self.content_type = content_type
+        self.etag = digest
+        self.cache_control = IMMUTABLE_CACHE if immutable else REVALIDATE_CACHE
+        self.variants = {}  # encoding (None = identity) -> StaticVariant
+
+def _is_compressible(content_type, size):
+    return size >= MIN_COMPRESS_SIZE and content_type.startswith(COMPRESSIBLE_TYPES)
+
+def _compress(encoding, data):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+def precompress(path, data, encodings=ENCODINGS):
+    """Write (or refresh) path.br / path.gz, returning {encoding: sibling path}"""
+    mtime = os.stat(path).st_mtime_ns
+    siblings = {}
+    for encoding in encodings:
+        if encoding == 'br' and brotli is None:
+            continue
+        sibling = path + SUFFIXES[encoding]
+        try:
+            if not os.path.exists(sibling) or os.stat(sibling).st_mtime_ns < mtime:
+                compressed = _compress(encoding, data)
+                if len(compressed) >= len(data):
+                    continue
+                # Workers starting together each write their own temp file;
+                # os.replace publishes whole files only, whoever wins
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        f.write(compressed)
+                    os.chmod(tmp_path, 0o644)
+                    os.replace(tmp_path, sibling)
+                except OSError:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
+            siblings[encoding] = sibling
+        except OSError as e:
+            print(f"Static files: could not precompress {path}: {e}")
+    return siblings
+
+def build_manifest(root=STATIC_ROOT, compress=True):
+    """Walk root and describe every servable file, keyed by URL path"""
+    manifest = {}
+    for directory, _, files in os.walk(root):
+        for name in files:
+            if name.endswith(('.br', '.gz', '.tmp')):
+                continue
+            path = os.path.join(directory, name)
+            url_path = os.path.relpath(path, root).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                data = f.read()
+
+            content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            if content_type.startswith('text/') or content_type == 'application/javascript':
+                content_type += '; charset=utf-8'
+            immutable = bool(HASHED_NAME.search(name))
+            asset = StaticAsset(url_path, content_type,
+                                hashlib.sha256(data).hexdigest()[:32], immutable)
+            in_memory = not immutable and len(data) <= MAX_MEMORY_SIZE
+
+            asset.variants[None] = StaticVariant(len(data), path, data if in_memory else None)
+            if compress and _is_compressible(content_type, len(data)):
+                for encoding, sibling in precompress(path, data).items():
+                    if in_memory:
+                        with open(sibling, 'rb') as f:
+                            body = f.read()
+                        asset.variants[encoding] = StaticVariant(len(body), body=body)
+                    else:
+                        asset.variants[encoding] = StaticVariant(os.stat(sibling).st_size, sibling)
+            manifest[url_path] = asset
+    return manifest
+
+class StaticFiles:
+    """Serves public/ from a manifest built once per worker"""
+    def __init__(self, root=STATIC_ROOT, index=INDEX_FILE, compress=True):
+        self.root = root
+        self.index = index
+        self.compress = compress
+        self.manifest = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            self.manifest = build_manifest(self.root, self.compress)
+
+    def lookup(self, path):
+        """The asset for a URL path, falling back to index.html for SPA routes"""
+        return self.manifest.get(path) or self.manifest.get(self.index)
+
+    def response(self, path, request, retry=True):
+        """Build the response for path (None if there is nothing to serve)"""
+        asset = self.lookup(path)
+        if asset is None:
+            return None
+
+        encoding = None
+        if len(asset.variants) > 1:
+            for candidate in ENCODINGS:
+                if candidate in asset.variants and request.accept_encodings[candidate]:
+                    encoding = candidate
+                    break
+        etag = asset.etag if encoding is None else f'{asset.etag}-{encoding}'
+
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            variant = asset.variants[encoding]
+            if variant.body is not None:
+                response = Response(variant.body, content_type=asset.content_type)
+            else:
+                try:
+                    file = open(variant.path, 'rb')
+                except FileNotFoundError:
+                    # The frontend was rebuilt under us: pick up the new manifest
+                    if not retry:
+                        return None
+                    self.load()
+                    return self.response(path, request, retry=False)
+                # wsgi.file_wrapper lets the server use sendfile()
+                response = Response(wrap_file(request.environ, file), content_type=asset.content_type,
+                                    direct_passthrough=True)
+                response.content_length = variant.size
+            if encoding:
+                response.content_encoding = encoding
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = asset.cache_control
+        if len(asset.variants) > 1:
+            response.vary.add('Accept-Encoding')
+        return response
+
+if __name__ == '__main__':
+    files = build_manifest()
+    compressed = sum(1 for asset in files.values() if len(asset.variants) > 1)
+    print(f"Static files: {len(files)} files, {compressed} precompressed in {STATIC_ROOT}")
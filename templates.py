@@ -0,0 +1,117 @@
+"""Compiled breakup message templates.
+
+Placeholders are written in square brackets, the way the seeded messages
+already use them: "Hi [Name], ...". A template is parsed once into its
+literal segments and the placeholder names (with their offsets in the
+source). Rendering then just joins the segments with the values, so it is
+linear in the output size and never re-scans the template. Compiled
+templates are cached by their source text, which makes built-in and
+user-defined templates share one cache.
+"""
+import json
+import re
+
+from cache import TTLCache
+
+# [Name], [Their Name], [pet_name]: a letter first, at most 32 characters
+PLACEHOLDER = re.compile(r'\[([A-Za-z][A-Za-z0-9_ ]{0,31})\]')
+MAX_TEMPLATE_LENGTH = 4000
+MAX_VALUE_LENGTH = 200
+
+COMPILED_CACHE_SIZE = 1024
+COMPILED_CACHE_TTL = 3600
+compiled_cache = TTLCache(maxsize=COMPILED_CACHE_SIZE, ttl=COMPILED_CACHE_TTL)
+
+# Rendered lines are sent in groups of this many per streamed chunk
+STREAM_BATCH = 100
+
+class TemplateError(ValueError):
+    """A template or a set of values cannot be used"""
+
+class CompiledTemplate:
+    """A template split into literal segments around its placeholders"""
+    __slots__ = ('source', 'literals', 'fields', 'offsets', 'variables')
+
+    def __init__(self, source):
+        literals, fields, offsets = [], [], []
+        position = 0
+        for match in PLACEHOLDER.finditer(source):
+            literals.append(source[position:match.start()])
+            fields.append(match.group(1))
+            offsets.append((match.start(), match.end()))
+            position = match.end()
+        literals.append(source[position:])
+
+        self.source = source
+        self.literals = tuple(literals)
+        self.fields = tuple(fields)
+        self.offsets = tuple(offsets)
+        # Distinct variable names in order of first use
+        self.variables = tuple(dict.fromkeys(fields))
+
+    def render(self, values):
+        """Fill in the placeholders; a variable without a value keeps its placeholder"""
+        if not self.fields:
+            return self.source
+        parts = [self.literals[0]]
+        for field, literal in zip(self.fields, self.literals[1:]):
+            value = values.get(field)
+            parts.append(f'[{field}]' if value is None else value)
+            parts.append(literal)
+        return ''.join(parts)
+
+    def missing(self, values):
+        """The variables that values does not provide"""
+        return [name for name in self.variables if values.get(name) is None]
+
+def compile_template(source):
+    """The compiled form of source, parsed at most once per cache lifetime"""
+    if not isinstance(source, str) or not source.strip():
+        raise TemplateError('Template content is required')
+    if len(source) > MAX_TEMPLATE_LENGTH:
+        raise TemplateError(f'Templates are limited to {MAX_TEMPLATE_LENGTH} characters')
+    template = compiled_cache.get(source)
+    if template is None:
+        template = CompiledTemplate(source)
+        compiled_cache.set(source, template)
+    return template
+
+def clean_values(values):
+    """Validate one recipient's values, returning {name: text}"""
+    if not isinstance(values, dict):
+        raise TemplateError('Recipient is not an object')
+    cleaned = {}
+    for name, value in values.items():
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise TemplateError(f"Invalid value for '{name}'")
+        value = str(value)
+        if len(value) > MAX_VALUE_LENGTH:
+            raise TemplateError(f"Value for '{name}' is longer than {MAX_VALUE_LENGTH} characters")
+        cleaned[name] = value
+    return cleaned
+
+def render_lines(template, recipients):
+    """Yield NDJSON for each recipient, STREAM_BATCH lines per chunk.
+
+    Every line carries the recipient's index. A recipient whose values are
+    invalid gets an error line instead of failing the whole stream.
+    """
+    lines = []
+    for index, values in enumerate(recipients):
+        try:
+            values = clean_values(values)
+        except TemplateError as e:
+            line = {'index': index, 'error': str(e)}
+        else:
+            line = {'index': index, 'content': template.render(values)}
+            missing = template.missing(values)
+            if missing:
+                line['missing'] = missing
+        lines.append(json.dumps(line, ensure_ascii=False, separators=(',', ':')))
+        if len(lines) >= STREAM_BATCH:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'